@@ -0,0 +1,60 @@
+""" benchmark Datasaver write throughput with h5py's guessed vs planned chunk shapes """
+
+import argparse
+from pathlib import Path
+import tempfile
+import time
+
+import h5py
+import numpy as np
+
+from qcore.helpers.datasaver import Datasaver
+from qcore.variables.datasets import Dataset
+
+# saved shapes of typical raw datasets, the first axis is the averaging axis
+CASES = {
+    "IQ 1D sweep": (20000, 200),
+    "IQ 3D sweep": (2000, 20, 30, 40),
+    "ADC traces": (1000, 20, 2000),
+}
+
+
+def bench(shape, batch_size, chunk_bytes, chunk_cache):
+    """return write throughput in MB/s and the chunk shape used"""
+    dataset = Dataset("data", axes=list(shape), save=True)
+    batch = np.random.default_rng(seed=0).random((batch_size, *shape[1:]))
+    kwargs = {"chunk_bytes": chunk_bytes, "chunk_cache": chunk_cache}
+    with tempfile.TemporaryDirectory() as folder:
+        path = Path(folder) / "bench.hdf5"
+        datasaver = Datasaver(path, dataset, batch_size=batch_size, **kwargs)
+        start = time.perf_counter()
+        with datasaver:
+            for pnum in range(0, shape[0], batch_size):
+                inum = min(pnum + batch_size, shape[0])
+                dataset.data = batch[: inum - pnum]
+                dataset.index = (slice(pnum, inum), ...)
+                datasaver.save_data(dataset)
+        elapsed = time.perf_counter() - start
+        with h5py.File(path, "r") as file:
+            chunks = file["data"].chunks
+    return np.prod(shape) * batch.itemsize / elapsed / 1e6, chunks
+
+
+def main():
+    """ """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--chunk-bytes", type=int, default=Datasaver.CHUNK_BYTES)
+    parser.add_argument("--chunk-cache", type=int, default=Datasaver.CHUNK_CACHE)
+    args = parser.parse_args()
+
+    print(f"{'case':<14}{'batch':>6}{'chunks':>10}{'MB/s':>10}  chunk shape")
+    for name, shape in CASES.items():
+        for batch_size in args.batch_sizes:
+            for label, chunk_bytes in (("h5py", None), ("planned", args.chunk_bytes)):
+                mbps, chunks = bench(shape, batch_size, chunk_bytes, args.chunk_cache)
+                print(f"{name:<14}{batch_size:>6}{label:>10}{mbps:>10.1f}  {chunks}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+""" benchmark Datasaver write throughput and compression ratio of Dataset compression
+filters on typical IQ and ADC data """
+
+import argparse
+from pathlib import Path
+import tempfile
+import time
+
+import h5py
+import numpy as np
+
+from qcore.helpers.datasaver import Datasaver, hdf5plugin
+from qcore.variables.datasets import Dataset
+
+# (compression, compression_opts, shuffle) of the filters to benchmark
+FILTERS = {
+    "none": (None, None, False),
+    "gzip-1": ("gzip", 1, True),
+    "gzip-4": ("gzip", 4, True),
+    "lzf": ("lzf", None, True),
+    "lzf-noshuffle": ("lzf", None, False),
+}
+if hdf5plugin is not None:
+    FILTERS["blosc"] = ("blosc", 5, True)
+    FILTERS["zstd"] = ("zstd", 3, True)
+
+
+def iq_data(reps, points, rng):
+    """demodulated IQ values of a resonator spectroscopy, noisy float data"""
+    signal = 1e-4 / (1 + np.linspace(-5, 5, points) ** 2)
+    return rng.normal(signal, 2e-5, size=(reps, points))
+
+
+def adc_data(reps, samples, rng):
+    """raw ADC traces, 12-bit integer levels stored as float data"""
+    trace = 300 * np.sin(2 * np.pi * 0.05 * np.arange(samples))
+    return np.round(rng.normal(trace, 20, size=(reps, samples))).clip(-2048, 2047)
+
+
+def bench(data, batch_size, compression, compression_opts, shuffle):
+    """return write throughput in MB/s and compression ratio"""
+    filters = {"compression": compression, "compression_opts": compression_opts}
+    axes = list(data.shape)
+    dataset = Dataset("data", axes=axes, save=True, shuffle=shuffle, **filters)
+    with tempfile.TemporaryDirectory() as folder:
+        path = Path(folder) / "bench.hdf5"
+        datasaver = Datasaver(path, dataset, batch_size=batch_size)
+        start = time.perf_counter()
+        with datasaver:
+            for pnum in range(0, len(data), batch_size):
+                dataset.data = data[pnum : pnum + batch_size]
+                dataset.index = (slice(pnum, pnum + len(dataset.data)), ...)
+                datasaver.save_data(dataset)
+        elapsed = time.perf_counter() - start
+        with h5py.File(path, "r") as file:
+            storage_size = file["data"].id.get_storage_size()
+    return data.nbytes / elapsed / 1e6, data.nbytes / storage_size
+
+
+def main():
+    """ """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--reps", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(seed=0)
+    cases = {
+        "IQ": iq_data(args.reps, 200, rng),
+        "ADC": adc_data(args.reps // 10, 2000, rng),
+    }
+
+    print(f"{'data':<6}{'filter':<16}{'MB/s':>10}{'ratio':>8}")
+    for name, data in cases.items():
+        for label, filters in FILTERS.items():
+            mbps, ratio = bench(data, args.batch_size, *filters)
+            print(f"{name:<6}{label:<16}{mbps:>10.1f}{ratio:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
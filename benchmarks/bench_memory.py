@@ -0,0 +1,75 @@
+""" benchmark the peak memory of streaming raw data through a Dataset to a datafile """
+
+import argparse
+from pathlib import Path
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+try:  # not available on Windows
+    import resource
+except ImportError:
+    resource = None
+
+from qcore.helpers.datasaver import Datasaver
+from qcore.variables.datasets import Dataset
+
+
+def bench(repetitions, points, batch_size, write_behind):
+    """return peak traced memory in MB while initializing and while running"""
+    rng = np.random.default_rng(seed=0)
+    batch = rng.random((batch_size, points))
+    avg = np.zeros(points)
+
+    tracemalloc.start()
+    dataset = Dataset("data", save=True)
+    dataset.initialize([repetitions, points])
+    init_peak = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.reset_peak()
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = Path(folder) / "bench.hdf5"
+        kwargs = {"batch_size": batch_size, "write_behind": write_behind}
+        datasaver = Datasaver(path, dataset, **kwargs)
+        start = time.perf_counter()
+        with datasaver:
+            for pnum in range(0, repetitions, batch_size):
+                inum = min(pnum + batch_size, repetitions)
+                dataset.update((batch[: inum - pnum], avg, None), pnum, inum)
+                datasaver.save_data(dataset)
+        elapsed = time.perf_counter() - start
+    run_peak = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    return init_peak, run_peak, elapsed
+
+
+def main():
+    """ """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repetitions", type=int, default=1_000_000)
+    parser.add_argument("--points", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--write-behind", action="store_true")
+    args = parser.parse_args()
+
+    raw_mb = args.repetitions * args.points * np.dtype(float).itemsize / 1e6
+    print(f"raw data: {args.repetitions} x {args.points} points = {raw_mb:.1f} MB")
+    init_peak, run_peak, elapsed = bench(
+        args.repetitions, args.points, args.batch_size, args.write_behind
+    )
+    print(f"peak traced memory on initialize: {init_peak:.1f} MB")
+    print(f"peak traced memory while saving: {run_peak:.1f} MB ({elapsed:.1f} s)")
+
+    if resource is None:
+        return
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    scale = 1e6 if sys.platform == "darwin" else 1e3
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    print(f"peak RSS of the process: {peak_rss:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,9 @@ __version__ = "1.2.3"
 from qcore.helpers.logger import logger
 from qcore.resource import Resource
 from qcore.experiment import Experiment
+from qcore.helpers.dataloader import Dataloader, load_many
 import qcore.libs.qua_macros as qua
+from qcore.helpers.plot_server import PlotServer
 from qcore.helpers.server import Server
 from qcore.helpers.stage import Stage
 from qcore.variables import Dataset, Sweep
@@ -2,20 +2,26 @@
 
 from datetime import datetime
 
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import ExitStack
 from pathlib import Path
 import time
 
+import h5py
+import numpy as np
 import qm.qua as qua
 from qm.qua._dsl import _ProgramScope, _Variable, _ResultSource
 
 from qcore.instruments.instrument import Instrument
 from qcore.instruments import QM
 from qcore.helpers.datasaver import Datasaver
+from qcore.helpers.fetcher import AdaptiveInterval, Fetcher
 from qcore.helpers.logger import logger
+from qcore.helpers.plot_server import PlotClient
 from qcore.helpers.plotter import Plotter
 from qcore.helpers.stage import Stage
 from qcore.libs.qua_macros import QuaVariable
+from qcore.libs.stats import RunningStats
 from qcore.modes.mode import Mode
 from qcore.pulses.pulse import Pulse
 from qcore.resource import Resource
@@ -207,8 +213,8 @@ class ExperimentManager:
         datasets: dict[str, Dataset],
         primary_datasets: list[str],
         sweep_dict: dict[str, Sweep],
-    ) -> None:
-        """ """
+    ) -> list[list[str]]:
+        """returns names of derived datasets grouped in the order of their updates"""
         # prepare Dataset axes
         for dset in datasets.values():
             if dset.name in primary_datasets:
@@ -230,6 +236,134 @@ class ExperimentManager:
             if dset.axes is None:
                 dset.initialize(axes=list(sweep_dict.values()))
 
+        levels = self.order_datasets(datasets)
+        for level in levels:  # inputs must know their raw mode before their outputs
+            for name in level:
+                self.inherit_raw_mode(datasets[name], datasets)
+        return levels
+
+    def order_datasets(self, datasets: dict[str, Dataset]) -> list[list[str]]:
+        """topologically sort derived datasets into levels, such that datasets in a
+        level only depend on primary datasets, sweeps and datasets in earlier levels.
+        datasets in the same level are independent of each other."""
+        derived = {name: dset for name, dset in datasets.items() if dset.inputs}
+        dependencies = {}
+        for name, dset in derived.items():
+            dependencies[name] = set(i for i in dset.inputs if i in derived)
+
+        levels = []
+        while dependencies:
+            level = [name for name, deps in dependencies.items() if not deps]
+            if not level:
+                message = (
+                    f"Found cyclic dependencies among derived datasets "
+                    f"{list(dependencies.keys())}."
+                )
+                logger.error(message)
+                raise DatasetInitializationError(message)
+            levels.append(level)
+            dependencies = {
+                name: deps - set(level)
+                for name, deps in dependencies.items()
+                if name not in level
+            }
+        logger.debug(f"Ordered derived datasets in {levels = }.")
+        return levels
+
+    def inherit_raw_mode(self, dset: Dataset, datasets: dict[str, Dataset]) -> None:
+        """derived datasets stream raw data the same way as all their input datasets,
+        datasets derived with non-incremental datafns only have averages"""
+        if not dset.is_incremental:
+            dset.raw, dset.decimation = "none", 1
+            return
+
+        inputs = [datasets[name] for name in dset.inputs if name in datasets]
+        modes = set((i.raw, i.decimation) for i in inputs)
+        if len(modes) > 1:
+            message = (
+                f"Input datasets of derived dataset '{dset.name}' must all have the "
+                f"same raw mode and decimation, found {modes = }."
+            )
+            logger.error(message)
+            raise DatasetInitializationError(message)
+        elif modes:
+            dset.raw, dset.decimation = modes.pop()
+
+    def validate_stop_args(self, stop_args: dict, datasets: dict[str, Dataset]) -> None:
+        """ """
+        for name in stop_args.get("target_sem", {}):
+            if name not in datasets or not datasets[name].has_stats:
+                message = (
+                    f"Cannot check convergence of '{name}', it must be a Dataset with "
+                    f"error bars i.e. with raw data or second moments streamed."
+                )
+                logger.error(message)
+                raise ExperimentInitializationError(message)
+
+    def restore_datasets(
+        self, filepath: Path, datasets: dict[str, Dataset], sweeps: dict[str, Sweep]
+    ) -> int:
+        """read back the datafile of an interrupted run, restore the averages and
+        running statistics of the datasets from the saved data and return the number of
+        repetitions saved"""
+        with h5py.File(filepath, "r") as file:
+            # the resumed run must sweep the same points as the interrupted run
+            for name, sweep in sweeps.items():
+                if sweep.save and name in file:
+                    if not np.array_equal(file[name][()], sweep.data):
+                        message = f"Sweep '{name}' points differ from {filepath.name}."
+                        logger.error(message)
+                        raise SweepValidationError(message)
+
+            counts = []  # repetitions saved to each dataset
+            for name, dset in datasets.items():
+                if dset.save and name in file:
+                    self.validate_saved_dataset(dset, file[name])
+                    if "count" in file[name].attrs:  # saved on exiting the Datasaver
+                        counts.append(int(file[name].attrs["count"]))
+                    elif dset.raw != "none":
+                        counts.append(len(file[name]) * dset.decimation)
+            if not counts:
+                message = f"Found no repetitions to resume from in {filepath.name}."
+                logger.error(message)
+                raise ExperimentInitializationError(message)
+            count = min(counts)
+
+            for name, dset in datasets.items():
+                if dset.datafn is not None and dset.raw == "none":
+                    continue  # averaged from its inputs on update
+                if not dset.save or name not in file:
+                    logger.warning(
+                        f"Dataset '{name}' was not saved, its averages and error bars "
+                        f"will only include the resumed repetitions."
+                    )
+                elif dset.raw == "none":  # the saved data is the average
+                    dset.restore(count, file[name][()])
+                else:  # merge the saved raw data in blocks of about 16MB
+                    h5dset, stats = file[name], RunningStats(dset.saved_shape[1:])
+                    rows = count // dset.decimation
+                    row_bytes = h5dset.dtype.itemsize * np.prod(h5dset.shape[1:])
+                    step = max(2**24 // int(row_bytes), 1)
+                    for start in range(0, rows, step):
+                        stats.update(h5dset[start : min(start + step, rows)])
+                    dset.restore(count, stats.mean, stats)
+        logger.debug(f"Restored datasets from {count} repetitions in {filepath.name}.")
+        return count
+
+    def validate_saved_dataset(self, dset: Dataset, h5dset: h5py.Dataset) -> None:
+        """ """
+        shape, saved_shape = dset.saved_shape, h5dset.shape
+        if dset.raw != "none":  # only the averaging axis may differ in length
+            shape, saved_shape = shape[1:], saved_shape[1:]
+        raw = h5dset.attrs.get("raw", "all")
+        if raw != dset.raw or shape != saved_shape:
+            message = (
+                f"Dataset '{dset.name}' with {dset.raw = } and {dset.saved_shape = } "
+                f"does not match the saved dataset with {raw = } and {h5dset.shape = }."
+            )
+            logger.error(message)
+            raise DatasetInitializationError(message)
+
 
 class Experiment:
     """generic experiment class written for executing QUA sequences on the QM OPX"""
@@ -250,10 +384,59 @@ class Experiment:
         pulses: dict[str, str],
         sweeps: list[Sweep],
         datasets: list[Dataset],
-        fetch_interval: int = 1,
+        fetch_interval: float = 1,
+        fetch_args: dict = None,
+        save_args: dict = None,
+        stop_args: dict = None,
+        plot_args: dict = None,
         **kwargs,
     ) -> None:
-        """ """
+        """
+        list of acceptable fetch_args, their meanings, and default values:
+        - queue_size: max number of fetched batches waiting to be processed, default = 8
+        - adaptive: tune the fetch interval to the result arrival rate, default = False
+        - target_batch: desired number of results per adaptive fetch, default = 100
+        - min_interval: lower bound on the adaptive fetch interval, default = 0.05
+        - max_interval: upper bound on the adaptive fetch interval, default = 5.0
+        - min_new: if specified, block each fetch until this many new results are
+        available (or the fetch interval elapses) instead of sleeping, default = None
+        - poll_interval: seconds between result counts while a fetch blocks, each count
+        is a server round trip, default = 0.1
+
+        list of acceptable save_args, their meanings, and default values:
+        - batch_size: expected number of repetitions per saved batch, used to align
+        dataset chunks with the batches, default = min_new or target_batch (if adaptive)
+        - chunk_bytes: target size of dataset chunks in bytes, None to let h5py guess,
+        default = 2**20
+        - chunk_cache: size of the hdf5 chunk cache in bytes, default = 2**26
+        - write_behind: write to the datafile in a background thread, default = False
+        - flush_interval: max seconds between datafile flushes in write-behind mode,
+        default = 1.0
+        - flush_bytes: max bytes of data pending in write-behind mode, default = 2**24
+        - queue_size: max writes waiting in write-behind mode, default = 64
+        - swmr: save data in SWMR mode such that the datafile can be read while the
+        experiment is running, default = False
+        - reference: path to a datafile whose identical instrument and mode snapshots
+        are linked to instead of saved again, or "first" to link the datafiles of a
+        Qcore Sweep to that of its first point, default = None
+        - single_file: save all points of a Qcore Sweep to one datafile, with the Qcore
+        Sweep as the leading dimension of all Datasets. the metadata of later points is
+        saved under "points/<index>", linking to snapshots unchanged since the previous
+        point. SWMR mode only saves the first point's metadata, default = False
+
+        list of acceptable stop_args, their meanings, and default values:
+        - open_ended: repeat until stopped from the plot window or until converged,
+        instead of for the number of 'N' sweep points, which then only sets the initial
+        size of the datafile, default = False
+        - target_sem: dict mapping names of Datasets with error bars to the largest
+        standard error of the mean (over all sweep points) at which they have converged,
+        the run is stopped once all of them have converged, default = None
+        - min_repetitions: repetitions to run before checking convergence, default = 10
+
+        list of acceptable plot_args, their meanings, and default values:
+        - server: live plot in the window of a PlotServer running in another process
+        instead of in a window opened by this process, default = False
+        """
         self.name = self.__class__.__name__
 
         self._folder = Path(folder)
@@ -279,6 +462,10 @@ class Experiment:
         self.datasets: dict[str, Dataset] = {dset.name: dset for dset in datasets}
 
         self.fetch_interval = fetch_interval
+        self.fetch_args = {} if fetch_args is None else fetch_args
+        self.save_args = {} if save_args is None else save_args
+        self.stop_args = {} if stop_args is None else stop_args
+        self.plot_args = {} if plot_args is None else plot_args
 
         # container for the various types of QuaVariables involved in this experiment
         self._qua_variables: dict[str, QuaVariable] = {}  # for all QuaVariables
@@ -300,14 +487,22 @@ class Experiment:
                 if sweep.name == "N":
                     self.repetitions = sweep.length
 
-        self._manager.init_datasets(self.datasets, primary_datasets, self._qua_sweeps)
+        # derived datasets are updated level by level, each level in parallel
+        self._derived_levels: list[list[str]] = self._manager.init_datasets(
+            self.datasets, primary_datasets, self._qua_sweeps
+        )
         for dataset in self.datasets.values():
             if dataset.stream:  # is qua dataset
                 self._qua_variables[dataset.name] = dataset
                 self._qua_datasets[dataset.name] = dataset
+        self._manager.validate_stop_args(self.stop_args, self.datasets)
 
         # initialize experiment attributes that will be set on run()
         self._qm = None
+        self._offset = 0  # repetitions restored from the datafile of an interrupted run
+        # instrument and mode snapshots are taken once per run, unless they may change
+        self._snapshots: dict[tuple[str, str], dict] = {}
+        self._reference = None  # datafile of the first point of a Qcore Sweep
 
     def sequence(self):
         raise NotImplementedError("Subclass(es) to implement sequence()")
@@ -334,6 +529,7 @@ class Experiment:
 
     def run(self):
         """ """
+        self._snapshots.clear()
         outermost_sweep = list(self.sweeps.values())[0]
         try:
             if not outermost_sweep.is_qua_sweep:
@@ -346,6 +542,41 @@ class Experiment:
             logger.info(msg)
             self._qm.disconnect()
 
+    def resume(self, datafile: Path):
+        """continue an interrupted run by saving further repetitions to its datafile,
+        until it holds 'repetitions' repetitions in total. the Experiment must be
+        specified with the same sweeps and datasets as the interrupted run, without a
+        Qcore Sweep."""
+        self._snapshots.clear()
+        filepath = Path(datafile)
+        if not list(self.sweeps.values())[0].is_qua_sweep:
+            message = f"Cannot resume '{self.name}' with an outermost Qcore Sweep."
+            logger.error(message)
+            raise ExperimentInitializationError(message)
+        if not filepath.exists():
+            message = f"Datafile to resume from does not exist at '{filepath}'."
+            logger.error(message)
+            raise ExperimentInitializationError(message)
+
+        count = self._manager.restore_datasets(filepath, self.datasets, self.sweeps)
+        msg = f"{count} / {self.repetitions} repetitions saved in {filepath.name}"
+        if count >= self.repetitions:
+            logger.info(f"Nothing to resume, found {msg}.")
+            return
+        logger.info(f"Resuming '{self.name}' from {msg}.")
+
+        filepath, self._filepath, self._offset = self._filepath, filepath, count
+        try:
+            self._run_qua_sweeps()
+        except KeyboardInterrupt:
+            msg = f"Experiment '{self.name}' interrupted, closing QM now..."
+            logger.info(msg)
+            self._qm.disconnect()
+        finally:  # later runs start from scratch in a new datafile
+            self._filepath, self._offset = filepath, 0
+            for dataset in self.datasets.values():
+                dataset._offset, dataset._prior_avg = 0, None
+
     def _run_with_qcore_sweep(self, qcore_sweep: Sweep):
         """ """
         name, target, points = qcore_sweep.name, qcore_sweep.target, qcore_sweep.data
@@ -372,8 +603,8 @@ class Experiment:
             logger.error(message)
             raise SweepValidationError(message)
 
-        if qcore_sweep.dtype is str:
-            has_resource_sweep_points = True
+        has_resource_sweep_points = np.issubdtype(qcore_sweep.dtype, np.str_)
+        if has_resource_sweep_points:
             try:
                 points = [self._resources[point] for point in points]
             except KeyError:
@@ -392,80 +623,145 @@ class Experiment:
 
         self._configure_resources()
 
+        if self.save_args.get("single_file", False):
+            self._run_in_single_file(qcore_sweep, target, points)
+            return
+
+        self._reference = None
         for point in points:
             setattr(target, name, point)
+            self._invalidate_snapshots(target)
             suffix = point.name if has_resource_sweep_points else str(point)
             tag = f"_{target.name}_{suffix}"
             filepath = self._get_filepath()
             self._filepath = filepath.parent / (filepath.stem + tag + filepath.suffix)
             self._run_qua_sweeps(point, exit_plotter=True)
+            self._reference = self._reference or self._filepath
             time.sleep(self.fetch_interval)
 
-    def _run_qua_sweeps(self, qcore_sweep_point=None, exit_plotter=False):
-        """ """
+    def _run_in_single_file(self, qcore_sweep: Sweep, target, points: list) -> None:
+        """run the Qcore Sweep with all its points saved to one datafile"""
+        if self.stop_args.get("open_ended", False):
+            message = "Open-ended Experiments cannot save all sweep points to one file."
+            logger.error(message)
+            raise ExperimentInitializationError(message)
+
+        self._get_filepath()
+        datasaver = self._get_datasaver(outer=qcore_sweep)
+        with datasaver:
+            for idx, point in enumerate(points):
+                setattr(target, qcore_sweep.name, point)
+                self._invalidate_snapshots(target)
+                if idx == 0:
+                    datasaver.save_metadata(self.metadata)
+                    if qcore_sweep.save:
+                        datasaver.save_data(qcore_sweep)
+                elif not datasaver.swmr:  # no metadata can be saved once data is
+                    datasaver.save_metadata(self.metadata, group=f"points/{idx}")
+                datasaver.point = idx
+                self._run_qua_sweeps(point, exit_plotter=True, datasaver=datasaver)
+                time.sleep(self.fetch_interval)
+
+    def _invalidate_snapshots(self, target) -> None:
+        """drop the cached snapshots that setting an attribute of target may change"""
+        if isinstance(target, Pulse):  # pulses are snapshotted as mode operations
+            for mode_name in self.modes:
+                self._snapshots.pop(("modes", mode_name), None)
+        elif isinstance(target, Mode):
+            self._snapshots.pop(("modes", target.name), None)
+            if target.lo_name is not None:  # the lo is set to the mode's lo frequency
+                self._snapshots.pop(("instruments", target.lo_name), None)
+        elif target is not self:  # experiment attributes are not cached
+            self._snapshots.pop(("instruments", target.name), None)
+
+    def _run_qua_sweeps(
+        self, qcore_sweep_point=None, exit_plotter=False, datasaver=None
+    ):
+        """datasaver: open Datasaver to save the data to, None to save a new datafile"""
+        if not self._offset:  # resumed datasets hold the restored repetitions
+            for dataset in self.datasets.values():
+                dataset.reset()
         self._qm: QM = self._get_qm()
         qua_program = self._build_qua_program()
-        self._qm.execute(qua_program, self.repetitions)
+        # live batches must stay valid while they wait in the Fetcher queue
+        queue_size = self.fetch_args.get("queue_size", Fetcher.QUEUE_SIZE)
+        # the averaging sweep 'N' is the pacing stream used to count available results
+        decimation = {}
+        for name, dset in self._qua_datasets.items():
+            if dset.raw == "decimated":
+                decimation[name] = dset.decimation
+        # only the repetitions that have not been restored are run
+        open_ended = self.stop_args.get("open_ended", False)
+        total_count = None if open_ended else self.repetitions - self._offset
+        args = (total_count, queue_size + 2, "N", decimation)
+        self._qm.execute(qua_program, *args)
 
         time.sleep(self.fetch_interval)
 
         dsets_to_save = {k: dset for k, dset in self.datasets.items() if dset.save}
         sweeps_to_save = {k: swp for k, swp in self._qua_sweeps.items() if swp.save}
 
-        datasaver = Datasaver(self._filepath, *self.datasets.values())
+        is_saved_here = datasaver is None  # else the caller saves the metadata
+        if is_saved_here:
+            datasaver = self._get_datasaver()
 
         to_plot = [dset for dset in self.datasets.values() if dset.plot]
-        plotter = Plotter(self.fetch_interval, self.name, self._filepath, *to_plot)
-
-        with datasaver:
-            datasaver.save_metadata(self.metadata)
-            while self._qm.is_processing():
-                if plotter.stop_expt:
-                    break
-
-                # fetch latest batch of partial data along with data counts
-                data, prev_count, incoming_count = self._qm.fetch()
-                plot_msg = f": {incoming_count} / {self.repetitions} data batches"
-                if data:  # to prevent update when empty data dict is fetched
-                    # update sweep data and save to datafile
-                    for name, sweep in sweeps_to_save.items():
-                        if sweep.is_qua_sweep:
-                            sweep.update(data[name])
-                            datasaver.save_data(sweep)
-
-                    # update primary datasets first
-                    for name, dset in self.datasets.items():
-                        if name in self.primary_datasets:
-                            rawdata = (data[name], data[f"{name}_avg"])
-                            dset.update(rawdata, prev_count, incoming_count)
-
-                    # update derived datasets
-                    for name, dset in self.datasets.items():
-                        if dset.inputs:  # is derived dataset with datafn and inputs
-                            dsets = []
-                            for i in dset.inputs:
-                                if i in self.datasets:
-                                    dsets.append(self.datasets[i])
-                                elif i in self.sweeps:
-                                    dsets.append(self.sweeps[i])
-                            dset.update(dsets, prev_count, incoming_count)
-                            data[name] = dset.data
-
-                    # process additional user-defined datasets in subclasses
-                    self.process_data(
-                        data,
-                        prev_count,
-                        incoming_count,
-                        qcore_sweep_point,
-                    )
-
-                    # save datasets and sweeps (after updating) to datafile
-                    for name, dataset in dsets_to_save.items():
-                        datasaver.save_data(dataset)
-
-                plotter.plot(message=plot_msg)  # update live plot
-
-                time.sleep(self.fetch_interval)
+        plotter_cls = PlotClient if self.plot_args.get("server", False) else Plotter
+        plotter = plotter_cls(self.fetch_interval, self.name, self._filepath, *to_plot)
+
+        # fetch results in a background thread, process them here as they arrive
+        fetcher = self._get_fetcher(queue_size)
+
+        # evaluate independent derived datasets concurrently, numpy releases the GIL
+        with ExitStack() as stack:
+            pool = stack.enter_context(ThreadPoolExecutor())
+            if is_saved_here:
+                stack.enter_context(datasaver)
+            if is_saved_here and not self._offset:  # resumed files hold the metadata
+                datasaver.save_metadata(self.metadata)
+            of_total = "" if open_ended else f" / {self.repetitions}"
+            count, is_halted = self._offset, False
+            plot_msg = f": {count}{of_total} data batches"
+            fetcher.start()
+            try:
+                while not fetcher.is_done:
+                    if plotter.stop_expt:
+                        break
+
+                    # get latest batch of partial data along with data counts
+                    batch = fetcher.get(timeout=self.fetch_interval)
+                    if batch is not None:
+                        data, prev_count, incoming_count = batch
+                        prev_count += self._offset
+                        incoming_count += self._offset
+                        count = incoming_count
+                        plot_msg = f": {count}{of_total} data batches"
+                        self._process_batch(
+                            data,
+                            prev_count,
+                            incoming_count,
+                            qcore_sweep_point,
+                            datasaver,
+                            dsets_to_save,
+                            sweeps_to_save,
+                            pool,
+                        )
+
+                        # results saved until the job halts are still fetched
+                        if not is_halted and self._has_converged(count):
+                            logger.info(f"{self.name} has converged after {count}.")
+                            self._qm.halt()
+                            is_halted = True
+
+                    plotter.plot(message=plot_msg)  # update live plot
+            finally:
+                fetcher.stop()
+
+            reps = self._qua_sweeps["N"]
+            if open_ended and reps.save and count:  # save the repetitions that ran
+                reps.update(reps.data[0] + np.arange(count))
+                datasaver.save_data(reps)
+                reps.update(None)  # the sweep points set the size of the next datafile
 
             self._qm.disconnect()
             logger.info(f"{self.name} experiment has stopped running!")
@@ -476,6 +772,100 @@ class Experiment:
             else:
                 plotter.plot(message=f"{plot_msg} [DONE]", stop=True)
 
+    def _has_converged(self, count: int) -> bool:
+        """ """
+        target_sem = self.stop_args.get("target_sem")
+        if not target_sem or count < self.stop_args.get("min_repetitions", 10):
+            return False
+        for name, target in target_sem.items():
+            dataset = self.datasets[name]
+            # the sem is zero until it can be estimated from at least two samples
+            if dataset.stats_count < 2 or np.max(dataset.sem) > target:
+                return False
+        return True
+
+    def _get_datasaver(self, outer: Sweep = None) -> Datasaver:
+        """outer: Qcore Sweep whose points are all saved to the datafile"""
+        batch_size = self.fetch_args.get("min_new")
+        if batch_size is None and self.fetch_args.get("adaptive", False):
+            batch_size = self.fetch_args.get("target_batch", 100)
+        save_args = {"batch_size": batch_size, "resume": self._offset > 0}
+        save_args.update(self.save_args)
+        if save_args.get("reference") == "first":
+            save_args["reference"] = self._reference
+        if save_args.pop("single_file", False):
+            save_args["outer"] = outer
+        return Datasaver(self._filepath, *self.datasets.values(), **save_args)
+
+    def _get_fetcher(self, queue_size: int) -> Fetcher:
+        """ """
+        adaptive = None
+        if self.fetch_args.get("adaptive", False):
+            keys = ("target_batch", "min_interval", "max_interval")
+            kwargs = {k: v for k, v in self.fetch_args.items() if k in keys}
+            adaptive = AdaptiveInterval(self.fetch_interval, **kwargs)
+        min_new = self.fetch_args.get("min_new")
+        poll_interval = self.fetch_args.get("poll_interval")
+        args = (queue_size, adaptive, min_new, poll_interval)
+        return Fetcher(self._qm, self.fetch_interval, *args)
+
+    def _process_batch(
+        self,
+        data,
+        prev_count,
+        incoming_count,
+        qcore_sweep_point,
+        datasaver,
+        dsets_to_save,
+        sweeps_to_save,
+        pool,
+    ):
+        """update sweeps and datasets with a fetched batch and save them to datafile"""
+        # update sweep data and save to datafile
+        for name, sweep in sweeps_to_save.items():
+            if sweep.is_qua_sweep:
+                if name in data:  # the pacing sweep 'N' is counted, not fetched
+                    sweep.update(data[name])
+                datasaver.save_data(sweep)
+
+        # update primary datasets first
+        for name, dset in self.datasets.items():
+            if name in self.primary_datasets:
+                # raw data and the second moment may not be streamed
+                avgs = (data[f"{name}_avg"], data.get(f"{name}_avg2"))
+                rawdata = (data.get(name), *avgs)
+                dset.update(rawdata, prev_count, incoming_count)
+
+        # update derived datasets in dependency order
+        def update_derived(name):
+            dset, dsets = self.datasets[name], []
+            for i in dset.inputs:
+                if i in self.datasets:
+                    dsets.append(self.datasets[i])
+                elif i in self.sweeps:
+                    dsets.append(self.sweeps[i])
+            dset.update(dsets, prev_count, incoming_count)
+
+        for level in self._derived_levels:
+            if len(level) == 1:
+                update_derived(level[0])
+            else:  # list() re-raises any exception raised in the pool
+                list(pool.map(update_derived, level))
+            for name in level:
+                data[name] = self.datasets[name].data
+
+        # process additional user-defined datasets in subclasses
+        self.process_data(
+            data,
+            prev_count,
+            incoming_count,
+            qcore_sweep_point,
+        )
+
+        # save datasets and sweeps (after updating) to datafile
+        for name, dataset in dsets_to_save.items():
+            datasaver.save_data(dataset)
+
     def process_data(self, data, prev_count, incoming_count, qcore_sweep_point):
         """Subclass(es) to implement process_data()"""
         pass
@@ -496,20 +886,30 @@ class Experiment:
                 logger.info(f"Set QUA variable attribute {name} for {self.name}.")
 
             # generate and enter QUA loop contexts programmatically
-            with ExitStack() as stack:
-                for name, sweep in self._qua_sweeps.items():
-                    logger.debug(f"Expect {sweep.length} '{name}' sweep points.")
-                    fn, *args = sweep.generate_loop()
-                    stack.enter_context(fn(*args))
-                    sweep.save_to_stream()
-                self.sequence()
-                for dataset in self._qua_datasets.values():
-                    dataset.save_to_stream()
+            reps, *sweeps = self._qua_sweeps.values()  # outermost sweep is always 'N'
+            logger.debug(f"Expect {reps.length} '{reps.name}' sweep points.")
+            if self.stop_args.get("open_ended", False):  # repeat until halted
+                fn, *args = (qua.infinite_loop_,)
+            else:
+                fn, *args = reps.generate_loop(skip=self._offset)
+            with fn(*args):
+                with ExitStack() as stack:
+                    for sweep in sweeps:
+                        logger.debug(f"Expect {sweep.length} '{sweep.name}' points.")
+                        fn, *args = sweep.generate_loop()
+                        stack.enter_context(fn(*args))
+                        sweep.save_to_stream()
+                    self.sequence()
+                    for dataset in self._qua_datasets.values():
+                        dataset.save_to_stream()
+                # saved after all datasets, once per completed repetition
+                reps.save_to_stream()
 
             with qua.stream_processing():
-                for idx, (sweep) in enumerate(self._qua_sweeps.values()):
-                    if idx != 0:  # we don't save repetitions at all
-                        sweep.process_stream()
+                # we don't save repetitions, the count of 'N' paces result fetching
+                reps.qua_stream.save_all(reps.tag)
+                for sweep in sweeps:
+                    sweep.process_stream()
                 for dataset in self._qua_datasets.values():
                     dataset.process_stream()
 
@@ -548,8 +948,8 @@ class Experiment:
     @property
     def metadata(self):
         """ """
-        inst_mdata = {k: i.snapshot() for k, i in self.instruments.items()}
-        mode_mdata = {k: m.snapshot(flatten=True) for k, m in self.modes.items()}
+        inst_mdata = {k: self._snapshot("instruments", k) for k in self.instruments}
+        mode_mdata = {k: self._snapshot("modes", k, flatten=True) for k in self.modes}
 
         xcls = (_Variable, Resource, _ResultSource)  # excluded classes
         xkeys = ("instruments", "modes", "pulses", "sweeps", "datasets")
@@ -559,3 +959,11 @@ class Experiment:
                 snapshot[k] = v
 
         return {"instruments": inst_mdata, "modes": mode_mdata, None: snapshot}
+
+    def _snapshot(self, group: str, name: str, **kwargs) -> dict:
+        """snapshot of a resource in group 'instruments' or 'modes', cached such that
+        unchanged (remote) resources are not snapshotted again"""
+        key = (group, name)
+        if key not in self._snapshots:
+            self._snapshots[key] = getattr(self, group)[name].snapshot(**kwargs)
+        return self._snapshots[key]
@@ -0,0 +1,260 @@
+""" """
+
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from pathlib import Path
+from typing import Union
+
+import h5py
+import numpy as np
+
+try:
+    import hdf5plugin  # registers the blosc and zstd filters for reading
+except ImportError:
+    hdf5plugin = None
+
+try:
+    import xarray as xr
+except ImportError:  # to_xarray() is not available
+    xr = None
+
+from qcore.helpers.datasaver import Datasaver
+from qcore.helpers.logger import logger
+from qcore.variables.datasets import Dataset
+from qcore.variables.sweeps import Sweep
+
+
+class DataLoadingError(Exception):
+    """ """
+
+
+class Dataloader:
+    """reader counterpart of the Datasaver, loads the Sweeps, Datasets and metadata
+    saved to a datafile. arrays are loaded lazily, i.e. data is only read from the
+    datafile when they are indexed, so please access them within a Dataloader context"""
+
+    def __init__(self, path: Path, mmap: bool = True, swmr: bool = False) -> None:
+        """
+        path: full path to the datafile.
+        mmap: if True, contiguous uncompressed datasets are memory-mapped, such that
+        indexing them reads data directly from the file without going through hdf5.
+        other datasets are returned as h5py Datasets, which read data on indexing. the
+        Datasaver writes chunked datasets only, so these always fall back to h5py reads,
+        mmap only applies to datafiles written contiguously by other means.
+        swmr: if True, open a datafile that is being saved in SWMR mode, call refresh()
+        on the returned h5py Datasets to see newly written data.
+        """
+        self._file = None  # internal reference to the hdf5 file
+        self._path = Path(path)
+        self.mmap = mmap
+        self.swmr = swmr
+
+    def __enter__(self) -> Dataloader:
+        """ """
+        try:
+            self._file = h5py.File(self._path, "r", swmr=self.swmr)
+        except OSError as err:
+            message = f"Could not open datafile {self._path}. Details: {err}."
+            logger.error(message)
+            raise DataLoadingError(message) from None
+        logger.debug(f"Started Dataloader session tagged to '{self._path}'.")
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
+        """ """
+        self._file.close()
+        self._file = None
+
+    @property
+    def datasets(self) -> list[str]:
+        """names of the Datasets saved to the datafile"""
+        file = self._validate_session()
+        return [k for k, v in file.items() if self._is_dataset(v)]
+
+    @property
+    def sweeps(self) -> list[str]:
+        """names of the Sweeps (coordinates) saved to the datafile"""
+        file = self._validate_session()
+        return [k for k, v in file.items() if self._is_sweep(v)]
+
+    @property
+    def metadata(self) -> dict[Union[str, None], dict]:
+        """metadata in the same structure as passed to Datasaver.save_metadata()"""
+        file = self._validate_session()
+        metadata = {None: self._read_attributes(file)}
+        for name, group in file.items():
+            if isinstance(group, h5py.Group):
+                metadata[name] = self._read_group(group)
+        return metadata
+
+    def get_array(self, name: str, lazy: bool = True) -> np.ndarray:
+        """return a memory-mapped array if possible, else an h5py Dataset if lazy, else
+        the array read into memory"""
+        h5dset = self._get_dataset(name)
+        if h5py.check_string_dtype(h5dset.dtype) is not None:
+            return h5dset.asstr()[()]  # strings are small, always read them
+        array = self._memmap(h5dset) if self.mmap else None
+        if array is not None:
+            return array
+        if self.mmap:
+            logger.debug(f"Cannot memory-map dataset '{name}', reading it with h5py.")
+        return h5dset if lazy else h5dset[()]
+
+    def load_sweep(self, name: str) -> Sweep:
+        """reconstruct a Sweep with the points saved to the datafile"""
+        h5dset = self._get_dataset(name)
+        points = self.get_array(name, lazy=False).tolist()
+        units = self._parse_attribute(h5dset.attrs.get("units"))
+        sweep = Sweep(name=name, units=units, points=points)
+        sweep.initialize()
+        return sweep
+
+    def load_dataset(self, name: str) -> Dataset:
+        """reconstruct a Dataset from its attributes and dimension scales, its 'data' is
+        the lazily loaded array saved to the datafile. the averages of Datasets saved
+        with raw = "none" are also loaded as their 'avg'."""
+        h5dset = self._get_dataset(name)
+        attrs = {k: self._parse_attribute(v) for k, v in h5dset.attrs.items()}
+        raw, count = attrs.get("raw", "all"), attrs.get("count", 0)
+        kwargs = {"raw": raw, "units": attrs.get("units", "A.U.")}
+        if raw == "decimated":
+            kwargs["decimation"] = attrs["decimation"]
+
+        axes = []
+        for idx, dim in enumerate(h5dset.dims):
+            label = dim.label
+            if label and label in self.sweeps:
+                sweep = self.load_sweep(label)
+                if sweep.length > h5dset.shape[idx]:  # dataset has been trimmed
+                    sweep.update(sweep.data[: h5dset.shape[idx]])
+                axes.append(sweep)
+            else:
+                axes.append(h5dset.shape[idx])
+        if raw != "all":  # the averaging axis is not saved as is, restore its length
+            # counts are saved per outer sweep point, which leads the averaging axis
+            outer = axes[:1] if np.ndim(count) else []
+            count, inner = int(np.max(count)), axes[len(outer) :]
+            axes = [*outer, count, *(inner if raw == "none" else inner[1:])]
+
+        dataset = Dataset(name, axes=axes, dtype=h5dset.dtype, **kwargs)
+        dataset.data = self.get_array(name)
+        dataset.count = count
+        if raw == "none":
+            dataset.avg = dataset.data
+        return dataset
+
+    def to_xarray(self, names: list[str] = None) -> xr.Dataset:
+        """return the Datasets with given names (default all) as an xarray Dataset, with
+        the Sweeps they are dimensioned by as coordinates. memory-mapped arrays stay
+        memory-mapped, others are read into memory."""
+        if xr is None:
+            message = "Loading data as xarray requires xarray, please install it."
+            logger.error(message)
+            raise DataLoadingError(message)
+
+        names = self.datasets if names is None else names
+        data_vars = {}
+        for name in names:
+            h5dset = self._get_dataset(name)
+            dims, coords = [], {}
+            for idx, dim in enumerate(h5dset.dims):
+                label = dim.label or f"{name}_dim_{idx}"
+                dims.append(label)
+                if label in self.sweeps:  # trimmed datasets may be shorter
+                    points = self.get_array(label, lazy=False)
+                    coords[label] = points[: h5dset.shape[idx]]
+            array = self.get_array(name, lazy=False)
+            attrs = {k: self._parse_attribute(v) for k, v in h5dset.attrs.items()}
+            attrs = {k: v for k, v in attrs.items() if not k.isupper()}  # no hdf5 attrs
+            data_vars[name] = xr.DataArray(array, coords, dims, name, attrs)
+        return xr.Dataset(data_vars, attrs={"filename": self._path.name})
+
+    def _validate_session(self) -> h5py.File:
+        """ """
+        if self._file is None:
+            message = (
+                f"The data file is not open. Please call data loading methods within "
+                f"a Dataloader context manager and try again."
+            )
+            logger.error(message)
+            raise DataLoadingError(message)
+        return self._file
+
+    def _get_dataset(self, name: str) -> h5py.Dataset:
+        """ """
+        file = self._validate_session()
+        h5dset = file.get(name)
+        if not isinstance(h5dset, h5py.Dataset):
+            message = f"Dataset '{name}' does not exist in {self._path.name}."
+            logger.error(message)
+            raise DataLoadingError(message)
+        return h5dset
+
+    def _is_dataset(self, h5dset) -> bool:
+        """Datasets are saved with their raw mode, Sweeps are dimension scales"""
+        if not isinstance(h5dset, h5py.Dataset):
+            return False
+        return "raw" in h5dset.attrs or not h5dset.is_scale
+
+    def _is_sweep(self, h5dset) -> bool:
+        """ """
+        return isinstance(h5dset, h5py.Dataset) and not self._is_dataset(h5dset)
+
+    def _memmap(self, h5dset: h5py.Dataset) -> Union[np.memmap, None]:
+        """memory-map a dataset stored contiguously without filters, else None"""
+        if h5dset.chunks is not None or h5dset.dtype.hasobject or not h5dset.size:
+            return None
+        offset = h5dset.id.get_offset()
+        if offset is None:  # storage has not been allocated
+            return None
+        shape, dtype = h5dset.shape, h5dset.dtype
+        return np.memmap(self._path, dtype=dtype, mode="r", offset=offset, shape=shape)
+
+    def _read_group(self, group: h5py.Group) -> dict:
+        """ """
+        metadata = self._read_attributes(group)
+        metadata.pop(Datasaver.HASH_ATTR, None)
+        for name, subgroup in group.items():
+            if isinstance(subgroup, h5py.Group):
+                metadata[name] = self._read_group(subgroup)
+        return metadata
+
+    def _read_attributes(self, group: h5py.Group) -> dict:
+        """ """
+        return {k: self._parse_attribute(v) for k, v in group.attrs.items()}
+
+    def _parse_attribute(self, value):
+        """undo the conventions of Datasaver._parse_attribute() where possible"""
+        if isinstance(value, h5py.Empty):  # None is saved as an empty attribute
+            return None
+        if isinstance(value, bytes):
+            return value.decode()
+        if isinstance(value, np.ndarray) and value.dtype.kind == "O":
+            return [v.decode() if isinstance(v, bytes) else v for v in value]
+        return value
+
+
+def _load(path: Path, names: list[str], mmap: bool) -> dict[str, np.ndarray]:
+    """load arrays in a worker process, memory-mapped ones are copied back"""
+    with Dataloader(path, mmap=mmap) as loader:
+        names = loader.datasets if names is None else names
+        return {name: np.array(loader.get_array(name, lazy=False)) for name in names}
+
+
+def load_many(
+    paths: list[Path],
+    names: list[str] = None,
+    mmap: bool = True,
+    max_workers: int = None,
+) -> list[dict[str, np.ndarray]]:
+    """load the Datasets with given names (default all) from many datafiles in parallel,
+    in worker processes because h5py serializes reads within a process. returns a dict
+    of arrays by name per datafile, in the order of 'paths'. on Windows, please call
+    this function under an if __name__ == "__main__" guard."""
+    paths = [Path(path) for path in paths]
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        results = list(pool.map(_load, paths, repeat(names), repeat(mmap)))
+    logger.debug(f"Loaded {len(results)} datafiles with {max_workers = }.")
+    return results
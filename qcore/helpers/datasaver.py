@@ -2,13 +2,25 @@
 
 from __future__ import annotations
 
+import hashlib
+import json
+from math import ceil, prod
 from numbers import Number
+import os
 from pathlib import Path
+import queue
+import threading
+import time
 from typing import Union
 
 import h5py
 import numpy as np
 
+try:
+    import hdf5plugin
+except ImportError:  # blosc and zstd compression are not available
+    hdf5plugin = None
+
 from qcore.variables.datasets import Dataset
 from qcore.helpers.logger import logger
 from qcore.variables.sweeps import Sweep
@@ -18,47 +30,282 @@ class DataSavingError(Exception):
     """ """
 
 
+def plan_chunks(
+    shape: tuple[int], itemsize: int, rows: int = None, target_bytes: int = 2**20
+) -> tuple[int]:
+    """plan the chunk shape of a dataset that is either written to in batches of 'rows'
+    along its first axis or, if rows is None, in one go. chunks hold at most
+    'target_bytes' (unless a single element is larger) and span a whole number of
+    batches where possible, such that a batch does not partially fill more chunks than
+    necessary. axes are split from the outermost inwards, keeping the innermost
+    (contiguous) axes whole for as long as possible."""
+    chunks = [max(n, 1) for n in shape]
+    if rows is not None:  # fill chunks with whole batches along the first axis
+        rows, fit = max(rows, 1), max(target_bytes // (itemsize * prod(chunks[1:])), 1)
+        chunks[0] = min(chunks[0], rows * (fit // rows) if fit >= rows else fit)
+
+    for i in range(len(chunks)):
+        nbytes = itemsize * prod(chunks)
+        if nbytes <= target_bytes:
+            break
+        chunks[i] = max(chunks[i] * target_bytes // nbytes, 1)
+    return tuple(chunks)
+
+
+def hash_metadata(metadata: dict) -> str:
+    """content hash of a metadata dict, metadata with equal hashes is saved identically.
+    values without a canonical representation are hashed by their repr, which at worst
+    makes equal metadata hash differently"""
+
+    def encode(value):
+        if isinstance(value, dict):
+            return {str(k): encode(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [encode(item) for item in value]
+        if isinstance(value, (set, frozenset)):
+            return sorted(json.dumps(encode(item)) for item in value)
+        if isinstance(value, np.ndarray):
+            return [str(value.dtype), value.shape, encode(value.tolist())]
+        if isinstance(value, (str, int, float, bool, type(None))):
+            return value
+        return repr(value)
+
+    text = json.dumps(encode(metadata), sort_keys=True)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
 class Datasaver:
     """ """
 
-    def __init__(self, path: Path, *datasets: Dataset) -> None:
+    CHUNK_BYTES: int = 2**20  # target size of a dataset chunk in bytes
+    CHUNK_CACHE: int = 2**26  # size of the hdf5 chunk cache in bytes
+    FLUSH_INTERVAL: float = 1.0  # max seconds between flushes in write-behind mode
+    FLUSH_BYTES: int = 2**24  # max bytes of pending writes in write-behind mode
+    QUEUE_SIZE: int = 64  # max writes waiting for the writer thread
+    HASH_ATTR: str = "snapshot_hash"  # attribute holding a snapshot's content hash
+
+    _STOP = object()  # sentinel put in the write queue on exiting the session
+
+    def __init__(
+        self,
+        path: Path,
+        *datasets: Dataset,
+        batch_size: int = None,
+        chunk_bytes: int = CHUNK_BYTES,
+        chunk_cache: int = CHUNK_CACHE,
+        write_behind: bool = False,
+        flush_interval: float = FLUSH_INTERVAL,
+        flush_bytes: int = FLUSH_BYTES,
+        queue_size: int = QUEUE_SIZE,
+        swmr: bool = False,
+        resume: bool = False,
+        reference: Path = None,
+        outer: Sweep = None,
+    ) -> None:
         """
         path: full path str to the datafile (must end in .h5 or .hdf5). DataSaver is not responsible for setting datafile naming/saving convention, the caller is.
         *datasets: Dataset objects to be saved.
+        batch_size: expected number of results (along the first axis) per save_data()
+        call, used to align dataset chunks with the saved batches. if None, chunks are
+        filled with as many results as fit in 'chunk_bytes'.
+        chunk_bytes: target size of dataset chunks in bytes, if None, h5py guesses the
+        chunk shape.
+        chunk_cache: size of the hdf5 chunk cache in bytes, must hold the chunks that
+        are partially written by a batch for them to be written to disk only once.
+        write_behind: if True, save_data() only queues a copy of the data, which is
+        written to the datafile by a background writer thread. Writes to adjacent
+        hyperslabs of the same dataset are coalesced into one and the datafile is
+        flushed once 'flush_interval' seconds have passed or 'flush_bytes' bytes are
+        pending, whichever is first. save_data() blocks when 'queue_size' writes are
+        waiting. All pending writes are written and flushed to disk on exiting the
+        DataSaver context.
+        swmr: if True, the datafile is switched to single-writer-multiple-reader (SWMR)
+        mode on the first save_data() call, such that other processes can read it while
+        data is being saved by opening it with h5py.File(path, "r", libver="latest",
+        swmr=True). datasets then grow as data is written to them and are flushed after
+        every write, readers must call refresh() on a dataset to see newly written data.
+        all metadata must be saved before the first save_data() call as no attributes or
+        groups can be added to the datafile in SWMR mode.
+        resume: if True, path is the existing datafile of an interrupted run, whose
+        datasets are extended to the shapes of the given datasets such that further data
+        can be saved to them, instead of creating a new datafile.
+        reference: path to a datafile saved earlier, snapshots (the dicts in named
+        metadata groups, e.g. one per instrument) identical to those in the reference
+        are saved as external links to it instead of being copied, such that only the
+        diff is stored. h5py follows these links transparently as long as the reference
+        is kept next to the datafile.
+        outer: Sweep whose points are all saved to this datafile, as the leading
+        dimension of every saved Dataset. set 'point' to the index of the current outer
+        sweep point before saving Datasets at that point, the Datasets' indices are then
+        relative to that point.
         """
         self._file = None  # internal reference to the hdf5 file
 
+        self.batch_size = batch_size
+        self.chunk_bytes = chunk_bytes
+        self.chunk_cache = chunk_cache
+        self.swmr = swmr
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._writer = None  # writer thread, runs during a write-behind session
+        self._write_error = None  # exception raised in the writer thread
+
         self._dataspec: dict[str, Union[Dataset, Sweep]] = {}  # internal attr
         self._datalog = {}  # to track Dataset size during saving
+        self._shapes: dict[str, tuple[int]] = {}  # shapes of the datasets in the file
+        self._written: dict[str, tuple[int]] = {}  # sizes already written if resumed
+        self._increments: dict[str, int] = {}  # rows to extend unlimited datasets by
+
+        self.reference = reference
+        self.outer = outer
+        self.point: int = 0  # index of the outer sweep point Datasets are saved at
+        self._counts: dict[str, np.ndarray] = {}  # Dataset counts per outer sweep point
+        self._snapshots: dict[str, tuple[str, str]] = {}  # (hash, path) of saved ones
 
         self._path = path
         self._path.parent.mkdir(exist_ok=True)  # avoid IOError due to missing directory
 
-        self._create_datasets(*datasets)
+        if resume:
+            self._open_datasets(*datasets)
+        else:
+            self._create_datasets(*datasets)
 
         logger.debug(f"Initialized a Datasaver tagged to data file at {self._path}.")
 
     def _create_datasets(self, *datasets: Dataset) -> None:
         """ """
         # mode = "x" means create file, fail if exists
-        with h5py.File(self._path, mode="x", track_order=True) as file:
+        libver = "latest" if self.swmr else None  # SWMR requires the latest file format
+        with h5py.File(self._path, mode="x", track_order=True, libver=libver) as file:
             coordinates = self._find_coordinates(*datasets)  # find sweeps of indep vars
+            # the averaging sweep of raw datasets is as unlimited as the datasets
+            raw = [d for d in datasets if d.save and d.raw == "all"]
+            unlimited = [d.saved_axes[0] for d in raw] if self.outer is None else []
             for name, sweep in coordinates.items():  # create coordinate datasets first
                 if sweep.save:
-                    self._create_dataset(file, shape=sweep.shape, **sweep.metadata)
+                    maxshape = (None,) if sweep in unlimited else sweep.shape
+                    kwargs = {"maxshape": maxshape, **sweep.metadata}
+                    self._create_dataset(file, shape=sweep.shape, **kwargs)
                     self._dataspec[name] = sweep
+                    self._shapes[name] = sweep.shape
 
             for dataset in datasets:
                 if dataset.save:
-                    self._create_dataset(file, shape=dataset.shape, **dataset.metadata)
+                    shape = self._saved_shape(dataset)  # depends on the raw mode
+                    kwargs = {
+                        "maxshape": self._get_maxshape(dataset),
+                        "chunks": self._plan_chunks(dataset),
+                        "filters": self._get_filters(dataset),
+                        **dataset.metadata,
+                    }
+                    self._create_dataset(file, shape=shape, **kwargs)
                     self._dataspec[dataset.name] = dataset
+                    self._shapes[dataset.name] = shape
                     self._dimensionalize_dataset(file, dataset)
 
+    def _open_datasets(self, *datasets: Dataset) -> None:
+        """extend the datasets of an existing datafile to be resumed"""
+        with h5py.File(self._path, mode="r+") as file:
+            entries = dict(self._find_coordinates(*datasets))
+            entries.update({dataset.name: dataset for dataset in datasets})
+            for name, entry in entries.items():
+                if not entry.save:
+                    continue
+                if name not in file:
+                    message = f"Dataset '{name}' does not exist in {self._path}."
+                    logger.error(message)
+                    raise DataSavingError(message)
+
+                h5dset = file[name]
+                shape = entry.shape if isinstance(entry, Sweep) else entry.saved_shape
+                if h5dset.maxshape and h5dset.maxshape[0] is None:  # keep all rows
+                    shape = (max(shape[0], h5dset.shape[0]), *shape[1:])
+                    self._increments[name] = h5dset.chunks[0]
+                self._written[name] = h5dset.shape
+                try:
+                    h5dset.resize(shape)
+                except (TypeError, ValueError) as err:
+                    message = (
+                        f"Cannot extend dataset '{name}' of {self._path.name} from "
+                        f"{h5dset.shape} to {shape = }. Details: {err}."
+                    )
+                    logger.error(message)
+                    raise DataSavingError(message) from None
+                self._dataspec[name] = entry
+                self._shapes[name] = shape
+                logger.debug(f"Resumed dataset '{name}': {h5dset.shape} -> {shape}.")
+
+    def _saved_axes(self, dataset: Dataset) -> list:
+        """axes of the dataset in the datafile, led by the outer sweep if any"""
+        axes = dataset.saved_axes
+        return axes if self.outer is None else [self.outer, *axes]
+
+    def _saved_shape(self, dataset: Dataset) -> tuple[int]:
+        """ """
+        axes = self._saved_axes(dataset)
+        return tuple(i.length if isinstance(i, Sweep) else i for i in axes)
+
+    def _get_maxshape(self, dataset: Dataset) -> tuple[int]:
+        """raw data is appended along axis 0, which is unlimited so that it can be
+        extended beyond the initial shape for resumed or open-ended runs"""
+        shape = self._saved_shape(dataset)
+        if self.outer is not None:  # every outer sweep point holds as much data
+            return shape
+        if dataset.raw == "none" or not shape:  # written in one go
+            return shape
+        return (None, *shape[1:])
+
+    def _plan_chunks(self, dataset: Dataset) -> Union[bool, tuple[int]]:
+        """ """
+        itemsize = np.dtype(dataset.dtype).itemsize
+        if self.chunk_bytes is None or not dataset.saved_shape or not itemsize:
+            return True  # let h5py guess
+
+        rows = None  # datasets with raw mode "none" are written in one go
+        if dataset.raw != "none":  # raw data is appended in batches along axis 0
+            rows = ceil((self.batch_size or 1) / dataset.decimation)
+        chunks = plan_chunks(dataset.saved_shape, itemsize, rows, self.chunk_bytes)
+        if self.outer is not None:  # points are saved one after the other
+            chunks = (1, *chunks)
+        logger.debug(f"Planned dataset '{dataset.name}' {chunks = }.")
+        return chunks
+
+    def _get_filters(self, dataset: Dataset) -> dict:
+        """h5py create_dataset() kwargs for the Dataset's compression settings"""
+        compression, opts = dataset.compression, dataset.compression_opts
+        shuffle = dataset.shuffle
+        if compression is None:
+            return {}
+        if compression in ("gzip", "lzf"):  # built into h5py
+            return {
+                "compression": compression,
+                "compression_opts": opts,
+                "shuffle": shuffle,
+            }
+
+        if hdf5plugin is None:
+            message = (
+                f"Compression '{compression}' of dataset '{dataset.name}' requires "
+                f"hdf5plugin, please install it or use 'gzip' or 'lzf' instead."
+            )
+            logger.error(message)
+            raise DataSavingError(message)
+
+        if compression == "blosc":  # blosc shuffles bytes itself
+            blosc = hdf5plugin.Blosc
+            shuffle = blosc.SHUFFLE if shuffle else blosc.NOSHUFFLE
+            clevel = 5 if opts is None else opts
+            return dict(blosc(cname="lz4", clevel=clevel, shuffle=shuffle))
+        clevel = 3 if opts is None else opts
+        return {**hdf5plugin.Zstd(clevel=clevel), "shuffle": shuffle}
+
     def _find_coordinates(self, *datasets: Dataset) -> dict[str, Sweep]:
         """coordinate datasets hold the data of Sweeps"""
         coordinates = {}  # dict prevents duplication of Sweeps
         for dataset in datasets:
-            for value in dataset.axes:
+            for value in self._saved_axes(dataset):
                 if isinstance(value, Sweep):
                     coordinates[value.name] = value
         logger.debug(f"Found {len(coordinates)} coordinates in the dataspec.")
@@ -70,20 +317,28 @@ class Datasaver:
         name: str,
         shape: tuple[int],
         dtype: str,
+        maxshape: tuple[int] = None,
         chunks: Union[bool, tuple[int]] = True,
+        filters: dict = None,
         **metadata,
     ) -> None:
-        """wrapper for h5py method. default fillvalue decided by h5py. metadata kwargs will be saved as dataset attrs"""
+        """wrapper for h5py method. default fillvalue decided by h5py. filters are h5py
+        compression kwargs. metadata kwargs will be saved as dataset attrs"""
+        if np.dtype(dtype).kind == "U":  # e.g. names of resources swept over
+            dtype = h5py.string_dtype()
         # by default, we create resizable datasets with shape = maxshape
         # we resize the dataset in __exit__() after all data is written to it
         dataset = file.create_dataset(
             name=name,
             shape=shape,
-            maxshape=shape,
+            maxshape=shape if maxshape is None else maxshape,
             chunks=chunks,
             dtype=dtype,
             track_order=True,
+            **({} if filters is None else filters),
         )
+        if dataset.maxshape and dataset.maxshape[0] is None:
+            self._increments[name] = dataset.chunks[0]  # extend by whole chunks
 
         for key, value in metadata.items():
             value = self._parse_attribute(key, value)
@@ -94,7 +349,8 @@ class Datasaver:
     def _dimensionalize_dataset(self, file: h5py.File, dataset: Dataset) -> None:
         """internal method for attaching dimension scales to a single dataset"""
         h5dset = file[dataset.name]  # h5py Dataset is different from a qcore Dataset
-        labels = [ax.name if isinstance(ax, Sweep) else None for ax in dataset.axes]
+        axes = self._saved_axes(dataset)
+        labels = [ax.name if isinstance(ax, Sweep) else None for ax in axes]
         for idx, label in enumerate(labels):
             if label is not None:
                 h5dset.dims[idx].label = label  # make dimension label
@@ -108,21 +364,67 @@ class Datasaver:
     def __enter__(self) -> Datasaver:
         """ """
         # 'r+' means read/write, file must exist
-        self._file = h5py.File(self._path, mode="r+")
+        self._file = self._open_file()
         logger.debug(f"Started DataSaver session tagged to '{self._file.filename}'.")
 
         # track the maximum value of the index the data is written to for each dimension
         # this will allow us to trim reziable datasets and mark uninitialized ones
-        for name, dataset in self._dataspec.items():
-            self._datalog[name] = [0] * len(dataset.shape)
+        for name, shape in self._shapes.items():
+            self._datalog[name] = list(self._written.get(name, [0] * len(shape)))
+
+        if self.write_behind:
+            self._write_error = None
+            self._writer = threading.Thread(target=self._write_behind, daemon=True)
+            self._writer.start()
+            logger.debug(f"Started writer thread for {self._path.name}.")
         return self
 
+    def _open_file(self) -> h5py.File:
+        """ """
+        libver = "latest" if self.swmr else None
+        return h5py.File(self._path, "r+", rdcc_nbytes=self.chunk_cache, libver=libver)
+
     def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
         """ """
-        # trim datasets
+        try:
+            if self._writer is not None:  # all data must be written before trimming
+                self._stop_writer()
+            if self._file.swmr_mode:  # datasets cannot be deleted in SWMR mode
+                self._file.close()
+                self._file = self._reopen_file()
+            if self._file is not None:
+                self._trim_datasets()
+                self._save_counts()
+        finally:
+            if self._file is not None:
+                self._file.close()
+            self._file = None
+
+    def _reopen_file(self) -> Union[h5py.File, None]:
+        """reopen the datafile without SWMR, return None if SWMR readers still have it
+        open. datasets have been grown to their written size in SWMR mode, so only the
+        deletion of datasets not written into is skipped in that case"""
+        try:
+            return self._open_file()
+        except OSError:  # readers hold a lock on the file
+            logger.warning(
+                f"Could not reopen {self._path.name} without SWMR as it is open in "
+                f"other processes, datasets not written into are left empty."
+            )
+
+    def _save_counts(self) -> None:
+        """save the number of repetitions each Dataset holds, for resuming the run"""
         for name, dataset in self._dataspec.items():
+            if isinstance(dataset, Dataset) and name in self._file:
+                count = dataset.count
+                if name in self._counts:  # per outer sweep point that has been saved
+                    count = self._counts[name][: self._file[name].shape[0]]
+                self._file[name].attrs["count"] = count
+
+    def _trim_datasets(self) -> None:
+        """ """
+        for name, init_shape in self._shapes.items():
             fin_shape = tuple(self._datalog[name])
-            init_shape = dataset.shape
 
             if all(idx == 0 for idx in fin_shape):  # dataset has not been written into
                 del self._file[name]  # delete dataset
@@ -131,9 +433,6 @@ class Datasaver:
                 self._file[name].resize(fin_shape)  # trim dataset
                 logger.debug(f"Resized dataset '{name}': {init_shape} -> {fin_shape}.")
 
-        self._file.close()
-        self._file = None
-
     def _validate_session(self) -> None:
         """check if hdf5 file is currently open (called when either save_data() or save_metadata() is called). enforces use of DataSaver context manager as the only means of writing to the data file."""
         if self._file is None:
@@ -158,17 +457,103 @@ class Datasaver:
         self._validate_session()
 
         name, data = dataset.name, dataset.data
+        if self.swmr and not self._file.swmr_mode:
+            self._start_swmr()
+        if isinstance(data, np.ndarray) and data.dtype.kind == "U":
+            data = data.astype(object)  # h5py only writes variable-length strings
+        count = None  # repetitions held by the dataset, saved along with its data
+        if isinstance(dataset, Dataset):
+            count = dataset.count
+            if self.outer is not None:
+                counts = self._counts.setdefault(name, np.zeros(self.outer.length, int))
+                counts[self.point] = dataset.count
+                count = counts.copy()
+
+        if self._writer is not None:  # leave writing to the writer thread
+            self._validate_dataset(name)
+            index = self._validate_index(dataset, len(self._shapes[name]))
+            self._allocate(name, index, data)
+            # data may be a view into a buffer that is overwritten before it is written
+            self._put((name, index, np.array(data), count))
+            logger.debug(f"Queued data for dataset '{name}' at '{index = }'")
+            self._track_size(name, index)
+            return
+
         # h5dset is a h5py Dataset, to distinguish it from our dataset
         h5dset = self._get_dataset(name)
-        index = self._validate_index(dataset, h5dset)
+        index = self._validate_index(dataset, h5dset.ndim)
+        self._allocate(name, index, data)
+        self._fit(h5dset, name, index)
         h5dset[index] = data
-        self._file.flush()
+        self._save_count(h5dset, count)
+        if self.swmr:
+            h5dset.flush()  # make the data visible to SWMR readers
+        else:
+            self._file.flush()
 
         shape = data.shape if isinstance(data, np.ndarray) else len(data)
         logger.debug(f"Wrote data with {shape = } to dataset '{name}' at '{index = }'")
 
         self._track_size(name, index)  # for trimming dataset if needed in __exit__()
 
+    def _save_count(self, h5dset: h5py.Dataset, count) -> None:
+        """save the repetitions written so far with every write, such that a run that
+        crashes before __exit__() can still be resumed. SWMR datafiles allow no
+        attribute changes, their datasets only hold the written repetitions anyway"""
+        if count is not None and not self.swmr:
+            h5dset.attrs["count"] = count
+
+    def _start_swmr(self) -> None:
+        """switch the datafile to SWMR mode, datasets are shrunk to their written size
+        and grow as data is written to them such that readers only see written data"""
+        for name in self._shapes:
+            self._file[name].resize(self._datalog[name])
+        self._file.swmr_mode = True
+        logger.debug(f"Switched {self._path.name} to SWMR mode.")
+
+    def _allocate(self, name: str, index, data) -> None:
+        """extend the shape allocated to an unlimited dataset written beyond its end, in
+        increments of whole chunks (or exactly, if the entire dataset is written)"""
+        if name not in self._increments:
+            return
+
+        shape = self._shapes[name]
+        if index is ...:
+            rows = len(data)
+        elif isinstance(index[0], slice) and index[0].stop is not None:
+            step = self._increments[name]
+            rows = max(ceil(index[0].stop / step) * step, shape[0])
+        elif isinstance(index[0], int):
+            rows = max(index[0] + 1, shape[0])
+        else:
+            return
+
+        if rows != shape[0]:
+            self._shapes[name] = (rows, *shape[1:])
+            logger.debug(f"Allocated dataset '{name}' {shape} -> {self._shapes[name]}.")
+
+    def _fit(self, h5dset: h5py.Dataset, name: str, index) -> None:
+        """resize dataset before writing at index, to the shape allocated to it or in
+        SWMR mode, to fit exactly the data written so far"""
+        allocated = self._shapes[name]
+        if not self.swmr:
+            if h5dset.shape != allocated:
+                h5dset.resize(allocated)
+            return
+
+        if index is ...:
+            shape = allocated
+        else:
+            shape = list(h5dset.shape)
+            for i, item in enumerate(index):
+                if isinstance(item, slice):
+                    stop = allocated[i] if item.stop is None else item.stop
+                    shape[i] = max(shape[i], stop)
+                else:  # item is an int
+                    shape[i] = max(shape[i], item + 1)
+        if tuple(shape) != h5dset.shape:
+            h5dset.resize(shape)
+
     def _get_dataset(self, name: str) -> h5py.Dataset:
         """ """
         try:
@@ -178,11 +563,21 @@ class Datasaver:
             logger.error(message)
             raise DataSavingError(message) from None
 
-    def _validate_index(self, dataset: Dataset, h5dset: h5py.Dataset) -> None:
+    def _validate_dataset(self, name: str) -> None:
+        """check that a dataset exists without accessing the file (write-behind mode)"""
+        if name not in self._shapes:
+            message = f"Dataset '{name}' does not exist in {self._path}."
+            logger.error(message)
+            raise DataSavingError(message)
+
+    def _validate_index(self, dataset: Dataset, ndims: int) -> None:
         """ """
         index = dataset.index
-        if index is ...:  # single ellipsis is a valid index
+        at_point = self.outer is not None and isinstance(dataset, Dataset)
+        if index is ... and not at_point:  # single ellipsis is a valid index
             return index
+        if index is ...:  # to be prefixed by the outer sweep point below
+            index = (...,)
 
         # isinstance check is necessary to ensure stable datasaving
         if not isinstance(index, tuple):
@@ -193,9 +588,12 @@ class Datasaver:
             logger.error(message)
             raise DataSavingError(message)
 
+        if at_point:  # Datasets are saved at the current outer sweep point
+            index = (self.point, *index)
+
         # to allow tracking of written data, convert any ... to slice(None, None)
         # such that the length of the index equals the no. of dataset dimensions
-        new_index, ndims = [], h5dset.ndim
+        new_index = []
         for i in range(ndims):
             if index[i] is ...:
                 new_index.extend([slice(None, None) for _ in range(ndims - i)])
@@ -204,10 +602,131 @@ class Datasaver:
                 new_index.append(index[i])
         return tuple(new_index)
 
+    def _put(self, item) -> None:
+        """put item in the write queue, blocking while it is full unless the writer
+        thread has failed"""
+        while True:
+            self._check_writer()
+            try:
+                self._queue.put(item, timeout=self.flush_interval)
+            except queue.Full:
+                continue
+            else:
+                break
+
+    def _check_writer(self) -> None:
+        """ """
+        if self._write_error is not None:
+            err = self._write_error
+            message = f"Failed to write data to {self._path}. Details: {err}."
+            logger.error(message)
+            raise DataSavingError(message) from self._write_error
+
+    def _stop_writer(self) -> None:
+        """write and flush all pending data, then wait for the writer thread to end"""
+        if self._writer.is_alive():
+            self._queue.put(Datasaver._STOP)
+            self._writer.join()
+        self._writer = None
+        self._check_writer()
+
+        # make the written data durable, not just handed over to the OS
+        self._file.flush()
+        os.fsync(self._file.id.get_vfd_handle())
+        logger.debug(f"Stopped writer thread, flushed {self._path.name} to disk.")
+
+    def _write_behind(self) -> None:
+        """writer thread, coalesces queued writes and writes them when a limit is hit"""
+        pending: dict[str, list] = {}  # pending writes per dataset
+        counts = {}  # repetitions held by the pending writes per dataset
+        nbytes, deadline = 0, time.perf_counter() + self.flush_interval
+        try:
+            while True:
+                timeout = max(deadline - time.perf_counter(), 0)
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    item = None
+
+                if item is Datasaver._STOP:
+                    break
+                if item is not None:
+                    name, index, data, count = item
+                    self._coalesce(pending.setdefault(name, []), index, data)
+                    counts[name] = count
+                    nbytes += data.nbytes
+
+                if nbytes >= self.flush_bytes or time.perf_counter() >= deadline:
+                    self._write_pending(pending, counts)
+                    nbytes, deadline = 0, time.perf_counter() + self.flush_interval
+            self._write_pending(pending, counts)
+        except Exception as err:
+            logger.error(f"Failed to write data to {self._path}. Details: {err}.")
+            self._write_error = err
+
+    def _coalesce(self, writes: list, index, data: np.ndarray) -> None:
+        """add a write to a dataset's pending writes, merging it with the last pending
+        write if their hyperslabs are adjacent along the first axis"""
+        if index is ...:  # supersedes all pending writes to the dataset
+            writes.clear()
+        elif writes and self._is_adjacent(writes[-1][0], index):
+            last_index, arrays = writes[-1]
+            arrays.append(data)
+            i = self._append_axis(index)
+            merged = slice(last_index[i].start, index[i].stop)
+            writes[-1][0] = (*index[:i], merged, *index[i + 1 :])
+            return
+        writes.append([index, [data]])
+
+    def _append_axis(self, index) -> int:
+        """axis along which data is appended, the first one not indexed by an int (e.g.
+        the outer sweep point), which maps to the first axis of the data"""
+        for i, item in enumerate(index):
+            if not isinstance(item, int):
+                return i
+        return len(index)
+
+    def _is_adjacent(self, index, next_index) -> bool:
+        """ """
+        if index is ... or next_index is ...:
+            return False
+        i = self._append_axis(index)
+        if i == len(index) or index[:i] != next_index[:i]:
+            return False
+        first, next_first = index[i], next_index[i]
+        if not (isinstance(first, slice) and isinstance(next_first, slice)):
+            return False
+        if first.step is not None or next_first.step is not None:
+            return False
+        if first.stop is None or first.stop != next_first.start:
+            return False
+        return index[i + 1 :] == next_index[i + 1 :]
+
+    def _write_pending(self, pending: dict[str, list], counts: dict) -> None:
+        """ """
+        if not pending:
+            return
+
+        num_writes = 0
+        for name, writes in pending.items():
+            h5dset = self._file[name]
+            for index, arrays in writes:
+                data = arrays[0] if len(arrays) == 1 else np.concatenate(arrays)
+                self._fit(h5dset, name, index)
+                h5dset[index] = data
+                num_writes += 1
+            self._save_count(h5dset, counts.pop(name, None))
+            if self.swmr:  # make the data visible to SWMR readers
+                h5dset.flush()
+        if not self.swmr:
+            self._file.flush()
+        pending.clear()
+        logger.debug(f"Wrote {num_writes} coalesced hyperslabs to {self._path.name}.")
+
     def _track_size(self, name: str, index: tuple[Union[int, slice]]) -> None:
         """ """
         if index is ...:  # we have written to the entire dataset
-            self._datalog[name] = self._dataspec[name].shape
+            self._datalog[name] = list(self._shapes[name])
             return
 
         size = self._datalog[name].copy()  # to be updated below based on index
@@ -215,28 +734,90 @@ class Datasaver:
             if isinstance(item, slice):
                 # stop = None means we have written data to this dimension completely
                 if item.stop is None:
-                    size[i] = self._dataspec[name].shape[i]  # maximum possible value
+                    size[i] = self._shapes[name][i]  # maximum possible value
                 else:  # compare with existing size along ith dimension
                     size[i] = max(size[i], item.stop)
             elif item is ...:
-                size[i] = self._dataspec[name].shape[i]  # maximum possible value
+                size[i] = self._shapes[name][i]  # maximum possible value
             else:  # item is an int
-                size[i] = max(size[i], item)
+                size[i] = max(size[i], item + 1)
         self._datalog[name] = size
         logger.debug(f"Tracked dataset '{name}' size: {self._datalog[name]}.")
 
-    def save_metadata(self, metadataspec: dict[Union[str, None], dict]) -> None:
+    def save_metadata(
+        self, metadataspec: dict[Union[str, None], dict], group: str = None
+    ) -> None:
         """metadataspec is a dict of dicts. outermost dict key = group in data file to save the metadata to. if key is a str, we create a group with that name. if key is None, we save to top level group in the file. value = metadata dict with key-value pair stored as attributes of the group named by their key. every key in the metadata dict must be a string. the following metadata dict values types/structures are recognized and saved according to the convention below (others are ignored and a warning is thrown):
         1. a single Number (int, float, complex) or string or bool is saved as is
         2. a numpy array, within hdf5 size limitations (<64kB) is saved as is
         3. collections (list, tuple, set, frozenset) are all cast to list, and if they contain all types in point (1), we save them as is. else, we convert the list to a dict with the value's index as the key and save this dictionary.
         4. None type is saved as an empty string as hdf5 doesn't have a native None type
-        4. a dictionary whose key-value pairs comply with the convention above"""
+        5. paths are saved as strings
+        6. a dictionary whose key-value pairs comply with the convention above
+        group: path of the group to save the metadata under instead of the top level
+        group, e.g. one per outer sweep point. snapshots identical to those saved last
+        under another group are saved as soft links to them."""
         self._validate_session()
-        file = self._file
+        if self._file.swmr_mode:
+            message = (
+                f"Cannot save metadata to {self._path.name} in SWMR mode, please save "
+                f"all metadata before saving any data."
+            )
+            logger.error(message)
+            raise DataSavingError(message)
+        hashes = self._read_hashes()
+        root = self._file if group is None else self._file.require_group(group)
         for name, metadata in metadataspec.items():
-            group = file if name is None else file.create_group(name, track_order=True)
-            self._save_metadata(group, **metadata)
+            if name is None:
+                self._save_metadata(root, **metadata)
+                continue
+            subgroup = root.create_group(name, track_order=True)
+            for key, value in metadata.items():
+                self._save_snapshot(subgroup, f"/{name}/{key}", value, hashes)
+
+    def _save_snapshot(self, group: h5py.Group, path: str, value, hashes: dict) -> None:
+        """save a snapshot as a subgroup tagged with its content hash, or link to an
+        identical snapshot saved earlier or held by the reference datafile. 'path' is
+        relative to the group the metadata is saved under"""
+        key = path.rsplit("/", 1)[-1]
+        if not isinstance(value, dict):
+            self._save_metadata(group, **{key: value})
+            return
+
+        digest, saved = hash_metadata(value), self._snapshots.get(path)
+        if saved is not None and saved[0] == digest:
+            group[key] = h5py.SoftLink(saved[1])
+            logger.debug(f"Linked snapshot '{group.name}/{key}' to '{saved[1]}'.")
+            return
+
+        if hashes.get(path) == digest:
+            filename = os.path.relpath(self.reference, self._path.parent)
+            group[key] = h5py.ExternalLink(filename, path)
+            logger.debug(f"Linked snapshot '{path}' to {self.reference}.")
+        else:
+            self._save_metadata(group, **{key: value})
+            group[key].attrs[Datasaver.HASH_ATTR] = digest
+        self._snapshots[path] = (digest, f"{group.name}/{key}")
+
+    def _read_hashes(self) -> dict[str, str]:
+        """return content hashes of the snapshots in the reference datafile by path"""
+        hashes = {}
+        if self.reference is None:
+            return hashes
+
+        try:
+            with h5py.File(self.reference, "r") as file:
+                groups = [g for g in file.values() if isinstance(g, h5py.Group)]
+                for snapshot in (s for group in groups for s in group.values()):
+                    if Datasaver.HASH_ATTR in snapshot.attrs:
+                        hashes[snapshot.name] = snapshot.attrs[Datasaver.HASH_ATTR]
+        except (OSError, KeyError) as err:
+            logger.warning(
+                f"Could not read snapshots from reference {self.reference}, saving all "
+                f"metadata to {self._path.name}. Details: {err}."
+            )
+            return {}
+        return hashes
 
     def _save_metadata(self, group: h5py.Group, **metadata) -> None:
         """internal method, made for recursive saving of metadata"""
@@ -277,6 +858,8 @@ class Datasaver:
                 return {str(idx): item for idx, item in enumerate(value)}
         elif value is None:
             return h5py.Empty("S10")
+        elif isinstance(value, os.PathLike):  # e.g. the reference in save_args
+            return str(value)
         else:
             logger.warning(
                 f"Found unusual {value = } of {type(value)} while parsing metadata "
@@ -0,0 +1,194 @@
+""" python threading """
+
+import queue
+import threading
+import time
+
+import numpy as np
+
+from qcore.helpers.logger import logger
+
+
+class AdaptiveInterval:
+    """Tune the interval between fetches to the observed result arrival rate, such that
+    each fetch returns approximately 'target_batch' new results. The rate (results per
+    second) is estimated from the fetched result counts with an exponentially weighted
+    moving average."""
+
+    def __init__(
+        self,
+        interval: float,  # initial interval in seconds, used until a rate is measured
+        target_batch: int = 100,  # desired number of new results per fetch
+        min_interval: float = 0.05,  # lower bound on the interval in seconds
+        max_interval: float = 5.0,  # upper bound on the interval in seconds
+        smoothing: float = 0.5,  # weight of the latest rate measurement, in (0, 1]
+    ) -> None:
+        """ """
+        self.target_batch = target_batch
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.smoothing = smoothing
+
+        self.interval = self._clip(interval)
+        self.rate: float = None  # estimated results per second
+        self._last = None  # (time, count) of the previous update
+
+    def _clip(self, interval: float) -> float:
+        """ """
+        return min(max(interval, self.min_interval), self.max_interval)
+
+    def update(self, count: int) -> float:
+        """update the rate estimate with the latest result count, return new interval"""
+        now = time.perf_counter()
+        if self._last is not None:
+            last_time, last_count = self._last
+            rate = (count - last_count) / (now - last_time)
+            if self.rate is None:
+                self.rate = rate
+            else:
+                self.rate = self.smoothing * rate + (1 - self.smoothing) * self.rate
+
+            if self.rate > 0:
+                self.interval = self._clip(self.target_batch / self.rate)
+            else:  # nothing arrived yet, back off
+                self.interval = self._clip(self.interval * 2)
+        self._last = (now, count)
+        return self.interval
+
+
+class Fetcher:
+    """Producer that pulls batches of results from a running QM job in a background
+    thread and puts them in a bounded queue, so that slow processing, saving or plotting
+    of one batch does not delay fetching of the next one.
+
+    Batches are (data, prev_count, incoming_count) tuples as returned by QM.fetch().
+    Batch data may be views into the QMResultFetcher's ring buffers, so the QM must be
+    executed with a buffer depth of at least QUEUE_SIZE + 2 (batches in the queue, being
+    put and being consumed).
+    """
+
+    QUEUE_SIZE: int = 8  # maximum number of batches waiting to be consumed
+
+    _DONE = object()  # sentinel put in the queue after the last batch
+
+    def __init__(
+        self,
+        qm,
+        interval: float,
+        queue_size: int = QUEUE_SIZE,
+        adaptive: AdaptiveInterval = None,
+        min_new: int = None,
+        poll_interval: float = None,
+    ) -> None:
+        """
+        qm: QM instance that has been executed, only the Fetcher thread may call its
+        is_processing() and fetch() methods after start().
+        interval: time in seconds to wait between successive fetches.
+        queue_size: maximum number of batches waiting to be consumed, the Fetcher blocks
+        (applies back-pressure) when the queue is full.
+        adaptive: if specified, the interval is tuned to the result arrival rate after
+        every fetch.
+        min_new: if specified, instead of sleeping between fetches, each fetch blocks
+        until 'min_new' new results are available or until the interval elapses.
+        poll_interval: seconds between result counts while a fetch blocks, each count is
+        a server round trip. None means QMResultFetcher.POLL_INTERVAL.
+        """
+        self._qm = qm
+        self.interval = interval if adaptive is None else adaptive.interval
+        self.adaptive = adaptive
+        self.min_new = min_new
+        self.poll_interval = poll_interval
+        self.queue = queue.Queue(maxsize=queue_size)
+
+        self.stop_event = threading.Event()  # set to stop fetching
+        self.is_done = False  # set by get() once the last batch has been consumed
+        self.error = None  # exception raised in the Fetcher thread, re-raised by get()
+
+        # back-pressure metrics
+        self.num_batches = 0  # number of batches put in the queue so far
+        self.num_full = 0  # number of times a batch was fetched while queue was full
+        self.blocked_time = 0.0  # total time in seconds spent waiting for queue space
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    @property
+    def metrics(self) -> dict[str, float]:
+        """ """
+        return {
+            "queued": self.queue.qsize(),
+            "queue_size": self.queue.maxsize,
+            "batches": self.num_batches,
+            "full": self.num_full,
+            "blocked_time": self.blocked_time,
+            "interval": self.interval,
+        }
+
+    def start(self) -> None:
+        """ """
+        self.thread.start()
+        logger.debug(f"Started fetching results every {self.interval}s.")
+
+    def stop(self) -> None:
+        """stop fetching and wait for the Fetcher thread to finish"""
+        self.stop_event.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        logger.debug(f"Stopped fetching results, {self.metrics = }.")
+
+    def run(self) -> None:
+        """ """
+        try:
+            while not self.stop_event.is_set() and self._qm.is_processing():
+                if self.min_new is None:
+                    data, prev_count, incoming_count = self._qm.fetch()
+                else:  # wake up as soon as enough new results are available
+                    args = (True, self.min_new, self.interval)
+                    if self.poll_interval is not None:
+                        args += (self.poll_interval,)
+                    data, prev_count, incoming_count = self._qm.fetch(*args)
+                if data:  # to prevent queueing when empty data dict is fetched
+                    self._put((data, prev_count, incoming_count))
+                if self.adaptive is not None:
+                    self.interval = self.adaptive.update(incoming_count)
+                if self.min_new is None:
+                    self.stop_event.wait(self.interval)
+        except Exception as err:
+            logger.error(f"Failed to fetch results. Details: {err}.")
+            self.error = err
+        finally:
+            self._put(Fetcher._DONE)
+
+    def _put(self, item) -> None:
+        """put item in the queue, blocking while it is full unless Fetcher is stopped"""
+        if self.queue.full():
+            self.num_full += 1
+            logger.warning(
+                f"Fetched results are queueing up faster than they can be processed, "
+                f"{self.metrics = }."
+            )
+
+        start = time.perf_counter()
+        while not self.stop_event.is_set():
+            try:
+                self.queue.put(item, timeout=self.interval)
+            except queue.Full:
+                continue
+            else:
+                if item is not Fetcher._DONE:
+                    self.num_batches += 1
+                break
+        self.blocked_time += time.perf_counter() - start
+
+    def get(self, timeout: float) -> tuple[dict[str, np.ndarray], int, int]:
+        """return the next batch, or None if no batch arrives within timeout seconds"""
+        try:
+            item = self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+        if item is Fetcher._DONE:
+            self.is_done = True
+            if self.error is not None:
+                raise self.error
+            return None
+        return item
@@ -0,0 +1,332 @@
+""" Plot server, to live plot experiments in a separate process """
+
+from multiprocessing import resource_tracker
+from multiprocessing.connection import Client, Connection, Listener
+from multiprocessing.shared_memory import SharedMemory
+import os
+from pathlib import Path
+import queue
+import threading
+
+import numpy as np
+import pyqtgraph as pg
+from PyQt6 import QtCore as qtc
+
+from qcore.helpers.logger import logger
+from qcore.helpers.plotter import Plotter, PlotterInitializationError
+from qcore.variables.datasets import Dataset
+from qcore.variables.sweeps import Sweep
+
+
+class PlotServer:
+    """plots experiments in one long-lived window in its own process, such that the
+    experiment process never runs Qt. experiments connect with a PlotClient, which
+    passes the averages and error bars of the plotted datasets through shared memory and
+    messages through a local socket. the window shows the last experiment to connect.
+
+    messages are pickled, so any process that can authenticate can run code in the
+    server and its clients. the authkey is a random per-user secret, read from the
+    environment variable AUTHKEY_ENV if set, else from KEYFILE, which is created on
+    first use and must only be readable by the user."""
+
+    ADDRESS = ("localhost", 9091)  # address of the socket the server listens on
+    AUTHKEY_ENV = "QCORE_PLOT_AUTHKEY"  # environment variable overriding the keyfile
+    KEYFILE = Path.home() / ".qcore/plot_server.key"  # holds the authkey
+    KEY_BYTES = 32  # length of the generated authkey
+    POLL_INTERVAL = 0.05  # seconds between checks for messages from clients
+
+    def __init__(self) -> None:
+        """ """
+        self._plotter = Plotter(1, "Qcore plot server", None, start=False)
+        self._connections = queue.Queue()  # accepted by the listener thread
+        self._clients: dict[Connection, dict[str, SharedMemory]] = {}  # by connection
+        self._active = None  # connection of the experiment being plotted
+        self._finishing = None  # connection waiting for its final data to be plotted
+        self._timer = None
+
+    @staticmethod
+    def get_authkey() -> bytes:
+        """the secret clients authenticate with, generated on first use"""
+        authkey = os.environ.get(PlotServer.AUTHKEY_ENV)
+        if authkey:
+            return authkey.encode()
+
+        keyfile = PlotServer.KEYFILE
+        keyfile.parent.mkdir(parents=True, exist_ok=True)
+        try:  # only the user may read and write the new keyfile
+            fd = os.open(keyfile, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:  # generated before, possibly by a concurrent process
+            if os.name == "posix" and keyfile.stat().st_mode & 0o077:
+                logger.warning(f"Plot server keyfile {keyfile} is readable by others.")
+        else:
+            with os.fdopen(fd, "wb") as file:
+                file.write(os.urandom(PlotServer.KEY_BYTES))
+        return keyfile.read_bytes()
+
+    def serve(self) -> None:
+        """blocking function, plots experiments until the plot window is closed"""
+        listener = Listener(PlotServer.ADDRESS, authkey=PlotServer.get_authkey())
+        thread = threading.Thread(target=self._listen, args=(listener,), daemon=True)
+        thread.start()
+        logger.info(f"Plot server setup complete! Listening at {PlotServer.ADDRESS}.")
+
+        pg.mkQApp()
+        self._timer = qtc.QTimer()
+        self._timer.timeout.connect(self._poll)
+        self._timer.start(int(PlotServer.POLL_INTERVAL * 1000))
+        try:
+            self._plotter.run()  # until the plot window is closed
+        finally:
+            listener.close()
+            for connection in list(self._clients):
+                self._disconnect(connection)
+            logger.info("Plot server teardown complete!")
+
+    def _listen(self, listener: Listener) -> None:
+        """runs in a daemon thread, accepts clients while the server is running"""
+        while True:
+            try:
+                self._connections.put(listener.accept())
+            except OSError:  # listener closed
+                return
+            except Exception as err:  # e.g. a client with a wrong authkey
+                logger.warning(f"Refused plot client. Details: {err}.")
+
+    def _poll(self) -> None:
+        """runs in the GUI thread, handles all messages received from clients"""
+        while not self._connections.empty():
+            self._clients[self._connections.get()] = {}
+
+        for connection in list(self._clients):
+            try:
+                while connection in self._clients and connection.poll():
+                    self._handle(connection, connection.recv())
+            except (EOFError, OSError):  # the experiment process has exited
+                logger.warning("Lost connection to a plot client.")
+                self._disconnect(connection)
+
+        if self._finishing is not None and not self._plotter.timer.isActive():
+            self._finish(self._finishing)
+
+    def _handle(self, connection: Connection, message: tuple) -> None:
+        """ """
+        kind, *args = message
+        if kind == "setup":
+            self._setup(connection, *args)
+        elif kind == "plot":
+            self._plot(connection, *args)
+
+    def _setup(self, connection, interval, expt_name, datafile, specs) -> None:
+        """ """
+        if self._finishing is not None:  # no need to wait for its fits anymore
+            self._finish(self._finishing)
+        buffers = {s["name"]: self._attach(s["buffer"]) for s in specs}
+        self._clients[connection] = buffers
+        datasets = [self._make_dataset(spec) for spec in specs]
+        datafile = None if datafile is None else Path(datafile)
+        try:
+            self._plotter.reset(interval, expt_name, datafile, *datasets)
+        except PlotterInitializationError as err:
+            connection.send(("error", str(err)))
+            self._disconnect(connection)
+            return
+        self._active = connection
+        connection.send(("ok",))
+        logger.info(f"Plotting {expt_name} with {len(datasets)} datasets.")
+
+    def _plot(self, connection, message, versions, stop) -> None:
+        """ """
+        if connection is not self._active:  # replaced by a later experiment
+            connection.send(("ack", {}))
+            if stop:
+                self._disconnect(connection)
+            return
+
+        for dataset in self._plotter.datasets:
+            if versions[dataset.name] == dataset.version:
+                continue
+            buffer = self._clients[connection][dataset.name]
+            avg, sem = np.ndarray((2, *dataset.avg.shape), buffer=buffer.buf).copy()
+            dataset.avg, dataset.sem = avg, sem
+            dataset.version = versions[dataset.name]
+        self._plotter.plot(message=message)
+
+        if stop:  # reply once the final data and its fits have been plotted
+            self._plotter.done_event.set()
+            self._finishing = connection
+        else:
+            connection.send(("ack", self._get_fits()))
+
+    def _finish(self, connection: Connection) -> None:
+        """ """
+        self._finishing = None
+        if connection in self._clients:
+            connection.send(("ack", self._get_fits()))
+            self._disconnect(connection)
+
+    def _get_fits(self) -> dict[str, tuple]:
+        """best fit and fit parameters of the plotted datasets that have been fitted"""
+        fits = {}
+        for dataset in self._plotter.datasets:
+            if dataset.fit_params is not None:
+                fits[dataset.name] = (dataset.best_fit, dataset.fit_params)
+        return fits
+
+    def _disconnect(self, connection: Connection) -> None:
+        """ """
+        for buffer in self._clients.pop(connection, {}).values():
+            buffer.close()  # the client unlinks the shared memory it has created
+        connection.close()
+        if connection is self._active:
+            self._active = None
+
+    def _attach(self, name: str) -> SharedMemory:
+        """ """
+        buffer = SharedMemory(name=name)
+        # the client owns the shared memory, stop our resource tracker from unlinking it
+        # shared memory is only tracked on posix, Windows frees it with the last handle
+        if os.name == "posix":
+            resource_tracker.unregister(buffer._name, "shared_memory")
+        return buffer
+
+    def _make_dataset(self, spec: dict) -> Dataset:
+        """reconstruct a plotted dataset from the description sent by a PlotClient"""
+        axes = []
+        for axis in spec["axes"]:
+            if isinstance(axis, int):
+                axes.append(axis)
+                continue
+            name, units, points = axis
+            sweep = Sweep(name=name, units=units, points=points)
+            sweep.initialize()
+            axes.append(sweep)
+        dataset = Dataset(spec["name"], plot=True, **spec["kwargs"])
+        dataset.initialize(axes)
+        return dataset
+
+
+class PlotClient:
+    """live plots datasets in the window of a PlotServer running in another process, in
+    place of a Plotter"""
+
+    TIMEOUT = 10.0  # seconds to wait for the final data and its fits to be plotted
+
+    def __init__(
+        self, interval: float, expt_name: str, datafile, *datasets: Dataset
+    ) -> None:
+        """ """
+        self.datasets = datasets
+        self.stop_expt = False  # to stop experiment if the plot server is closed
+        self._is_waiting = False  # set until the server has plotted the last update
+
+        authkey = PlotServer.get_authkey()
+        try:
+            self._conn = Client(PlotServer.ADDRESS, authkey=authkey)
+        except OSError as err:
+            message = (
+                f"Plot server requested but not found at {PlotServer.ADDRESS}. "
+                f"Please start one with PlotServer().serve(). Details: {err}."
+            )
+            logger.error(message)
+            raise PlotterInitializationError(message) from None
+
+        # the average and sem of each dataset are passed through shared memory
+        self._buffers: dict[str, SharedMemory] = {}
+        self._arrays: dict[str, np.ndarray] = {}
+        specs = []
+        for dataset in datasets:
+            shape = (2, *dataset.shape[1:])
+            size = int(np.prod(shape)) * np.dtype(float).itemsize
+            buffer = SharedMemory(create=True, size=max(size, 1))
+            self._buffers[dataset.name] = buffer
+            self._arrays[dataset.name] = np.ndarray(shape, buffer=buffer.buf)
+            specs.append(self._describe(dataset, buffer.name))
+
+        datafile = None if datafile is None else str(datafile)
+        self._conn.send(("setup", interval, expt_name, datafile, specs))
+        reply = self._conn.recv()
+        if reply[0] == "error":
+            self.close()
+            logger.error(reply[1])
+            raise PlotterInitializationError(reply[1])
+
+    def _describe(self, dataset: Dataset, buffer: str) -> dict:
+        """all the plot server needs to know to plot the dataset"""
+        axes = []
+        for axis in dataset.axes:
+            if isinstance(axis, Sweep):
+                axes.append((axis.name, axis.units, axis.data.tolist()))
+            else:
+                axes.append(axis)
+        kwargs = {"units": dataset.units, "plot_args": dataset.plot_args}
+        kwargs.update({"raw": dataset.raw, "second_moment": dataset.second_moment})
+        if dataset.fitfn is not None:
+            kwargs["fitfn"] = dataset.fitfn.__name__
+        return {"name": dataset.name, "axes": axes, "buffer": buffer, "kwargs": kwargs}
+
+    def plot(self, message, stop=False, exit=False) -> None:
+        """updates are skipped while the server is busy plotting the previous one,
+        except the final update. 'exit' is ignored as the plot window stays open for the
+        next experiment."""
+        if self._conn is None:
+            return
+        self._receive(timeout=PlotClient.TIMEOUT if stop else 0)
+        if self._is_waiting and stop:
+            logger.warning("Plot server is not responding, skipped the final update.")
+            self.close()
+        if self._is_waiting or self._conn is None:
+            return
+
+        versions = {}
+        for dataset in self.datasets:
+            array = self._arrays[dataset.name]
+            array[0], array[1] = dataset.avg, dataset.sem
+            versions[dataset.name] = dataset.version
+        self._send(("plot", message, versions, stop))
+
+        if stop:  # wait for the final fits before releasing the shared memory
+            self._receive(timeout=PlotClient.TIMEOUT)
+            if self._conn is not None:
+                self.close()
+
+    def close(self) -> None:
+        """ """
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        self._arrays.clear()  # release the exported buffers before closing them
+        for buffer in self._buffers.values():
+            buffer.close()
+            buffer.unlink()
+        self._buffers.clear()
+
+    def _send(self, message: tuple) -> None:
+        """ """
+        try:
+            self._conn.send(message)
+        except OSError:
+            self._lose_connection()
+        else:
+            self._is_waiting = True
+
+    def _receive(self, timeout: float) -> None:
+        """process the replies of the server that arrive within the timeout"""
+        try:
+            while self._is_waiting and self._conn.poll(timeout):
+                _, fits = self._conn.recv()
+                self._is_waiting = False
+                for name, (best_fit, fit_params) in fits.items():
+                    dataset = next(d for d in self.datasets if d.name == name)
+                    dataset.best_fit, dataset.fit_params = best_fit, fit_params
+        except (EOFError, OSError):
+            self._lose_connection()
+
+    def _lose_connection(self) -> None:
+        """ """
+        logger.warning("Lost connection to the plot server, stopping the experiment.")
+        self.stop_expt = True
+        self.close()
+
+
+if __name__ == "__main__":
+    PlotServer().serve()
@@ -1,5 +1,8 @@
 """ python threading """
 
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import queue
 import threading
 import time
 
@@ -18,13 +21,39 @@ class PlotterInitializationError(Exception):
     """ """
 
 
+def decimate(y: np.ndarray, max_points: int) -> np.ndarray:
+    """return sorted indices of at most max_points points of y, keeping the min and max
+    of y in each of max_points // 2 equal bins so that peaks and dips are kept"""
+    y = np.asarray(y)
+    num_points = len(y)
+    if num_points <= max_points:
+        return np.arange(num_points)
+
+    num_bins = max(max_points // 2, 1)
+    bin_size = -(-num_points // num_bins)  # ceiling division
+    pad = bin_size * num_bins - num_points
+    bins = np.pad(y, (0, pad), mode="edge").reshape(num_bins, bin_size)
+    offsets = np.arange(num_bins) * bin_size
+    is_nan = np.isnan(bins)
+    mins = np.argmin(np.where(is_nan, np.inf, bins), axis=1) + offsets
+    maxs = np.argmax(np.where(is_nan, -np.inf, bins), axis=1) + offsets
+    indices = np.unique(np.concatenate((mins, maxs)))
+    return indices[indices < num_points]  # drop padding
+
+
 class PlotSpec:
-    """ """
+    """describes how a dataset is plotted. the pyqtgraph items that plot it are only
+    created by build() while its plot is shown, release() drops them if it is hidden"""
 
     def __init__(self, dataset: Dataset) -> None:
         """ """
-        self.plot_item = pg.PlotItem()
+        self.plot_item = None  # will be set by build()
         self.fit_label = None  # will be set by Plotter
+        self.version = -1  # version of the dataset last plotted, to skip unchanged ones
+        self.fit_version = 0  # version of the dataset last fitted, 0 has no data yet
+        self.view_changed = False  # set if the x range or size of the view has changed
+        self.is_clipped = False  # set if only the data in view was last plotted
+        self.fits: dict[int, tuple] = {}  # (version, best fit, best values) per trace
 
         # determine plot type
         supported_plot_types = ("scatter", "line", "image")
@@ -37,32 +66,43 @@ class PlotSpec:
                 raise PlotterInitializationError(msg)
             self.plot_type = plot_type
 
-        if self.plot_type in ("scatter", "line"):
-            self.plot_legend = self.plot_item.addLegend(offset=(-1, 1))
-
         # determine the number of data items per plot
         shape = dataset.shape
-        data_dim = len(shape) - 1  # discard 1 averaging dimension "N"
+        self.data_dim = len(shape) - 1  # discard 1 averaging dimension "N"
         self.num_data_items = 1  # default number of data items in one plot item
-        if data_dim == 2 and not self.plot_type == "image":
+        if self.data_dim == 2 and not self.plot_type == "image":
             self.num_data_items = shape[-2]
-        elif data_dim == 1 and self.plot_type == "image":
+        elif self.data_dim == 1 and self.plot_type == "image":
             msg = f"Invalid dataset {shape = } dimensions for '{self.plot_type}' plot."
             logger.error(msg)
             raise PlotterInitializationError(msg)
 
+        # too many traces to tell apart are plotted as an image instead
         if self.num_data_items > Plotter.MAX_DATA_ITEMS:
-            msg = f"Maximum {Plotter.MAX_DATA_ITEMS} data items per plot item allowed."
-            logger.error(msg)
-            raise PlotterInitializationError(msg)
-
-        # determine whether or not to plot errorbars, default = True
-        self.plot_err = True
+            logger.info(
+                f"Plotting the {self.num_data_items} traces of '{dataset.name}' as an "
+                f"image, max {Plotter.MAX_DATA_ITEMS} traces are plotted per plot item."
+            )
+            self.plot_type, self.num_data_items = "image", 1
+
+        # determine whether or not to plot errorbars, default = True if available
+        self.plot_err = dataset.has_stats
         if self.plot_type == "image":
             self.plot_err = False
         elif "plot_err" in dataset.plot_args:
             self.plot_err = dataset.plot_args["plot_err"]
 
+    @property
+    def is_built(self) -> bool:
+        """whether the pyqtgraph items of this plot exist i.e. it is being shown"""
+        return self.plot_item is not None
+
+    def build(self, dataset: Dataset) -> None:
+        """create the pyqtgraph items that plot the dataset"""
+        self.plot_item = pg.PlotItem()
+        if self.plot_type in ("scatter", "line"):
+            self.plot_legend = self.plot_item.addLegend(offset=(-1, 1))
+
         # initialize pyqtgraph graphics objects and add them to the plot item
         self.plot_data_items = []
         self.plot_err_items = []
@@ -75,7 +115,8 @@ class PlotSpec:
             elif self.plot_type == "line":
                 plot_data_item = pg.PlotCurveItem(pen=color)
             elif self.plot_type == "image":
-                plot_data_item = pg.ImageItem()
+                # downsample images to the resolution they are displayed at
+                plot_data_item = pg.ImageItem(autoDownsample=True)
                 cmap = dataset.plot_args.get("cmap", "viridis")
                 self.cbar = self.plot_item.addColorBar(
                     plot_data_item, colorMap=cmap, interactive=False
@@ -123,14 +164,14 @@ class PlotSpec:
                 xaxis = axes[-1]
                 xlabel = f"{xaxis.name} ({xaxis.units})"
         if not ylabel:
-            if data_dim == 2 and self.plot_type == "image":
+            if self.data_dim == 2 and self.plot_type == "image":
                 yaxis = axes[-2]
                 if isinstance(yaxis, Sweep):
                     ylabel = f"{yaxis.name} ({yaxis.units})"
             else:
                 ylabel = f"{dataset.name} ({dataset.units})"
         if not title:
-            if data_dim == 2 and self.plot_type == "image":
+            if self.data_dim == 2 and self.plot_type == "image":
                 title = f"{dataset.name} ({dataset.units}) vs [{ylabel}, {xlabel}]"
             else:
                 title = f"{dataset.name} ({dataset.units}) vs {xlabel}"
@@ -139,20 +180,88 @@ class PlotSpec:
         self.plot_item.showGrid(x=True, y=True, alpha=0.5)
         self.plot_item.setMenuEnabled(False)
 
+    def release(self) -> None:
+        """drop the pyqtgraph items, the dataset is replotted when built again"""
+        self.plot_item, self.fit_label = None, None
+        self.plot_data_items, self.plot_err_items, self.plot_fit_items = [], [], []
+        self.version, self.view_changed, self.is_clipped = -1, False, False
+
+
+class LiveFitter:
+    """fits traces of plotted datasets in a thread pool so that slow fits do not block
+    the GUI thread. while a trace is being fitted, only its latest data waits to be
+    fitted next and older data is skipped. fits are warm-started from the previous best
+    values of the same trace."""
+
+    def __init__(self, max_workers: int = None) -> None:
+        """ """
+        self._pool = ThreadPoolExecutor(max_workers, thread_name_prefix="fit")
+        self._lock = threading.Lock()  # guards _running and _pending
+        self._running = set()  # keys of traces being fitted
+        self._pending = {}  # latest (fitfn, version, y, x) waiting per trace key
+        self._best_values = {}  # best values of the last fit per trace key
+        self._results = queue.Queue()  # (key, version, best fit, best values)
+
+    @property
+    def is_busy(self) -> bool:
+        """ """
+        with self._lock:
+            return bool(self._running)
+
+    def submit(self, key, fitfn, version: int, y: np.ndarray, x: np.ndarray) -> None:
+        """fit y vs x of the trace identified by key, with the dataset's version"""
+        args = (fitfn, version, np.array(y), np.array(x))
+        with self._lock:
+            if key in self._running:  # supersedes any data waiting to be fitted
+                self._pending[key] = args
+                return
+            self._running.add(key)
+        self._pool.submit(self._fit, key, *args)
+
+    def results(self) -> list[tuple]:
+        """return the fit results that have arrived since the last call"""
+        results = []
+        while not self._results.empty():
+            results.append(self._results.get())
+        return results
+
+    def shutdown(self) -> None:
+        """ """
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _fit(self, key, fitfn, version, y, x) -> None:
+        """runs in the pool, fits the trace until no newer data is pending"""
+        while True:
+            try:
+                warm_start = self._best_values.get(key)
+                best_fit, best_values = fitfn(y, x, warm_start=warm_start)
+            except Exception as err:
+                logger.warning(f"Failed to fit {fitfn.__name__}. Details: {err}.")
+            else:
+                self._best_values[key] = best_values
+                self._results.put((key, version, best_fit, best_values))
+
+            with self._lock:
+                if key not in self._pending:
+                    self._running.discard(key)
+                    return
+                fitfn, version, y, x = self._pending.pop(key)
+
 
 class PlotWidget(pg.GraphicsLayoutWidget):
     """ """
 
     def __init__(self, filename, *args, **kwargs):
-        """ """
+        """filename: path to export the plots to when the window is closed, or None"""
         super().__init__(*args, **kwargs)
-        self.filename = str(filename)
+        self.filename = filename
         self.window_closed = threading.Event()  # set if plot window closed by the user
 
     def closeEvent(self, *args, **kwargs):
         """ """
         self.window_closed.set()
-        ImageExporter(self.ci).export(self.filename)
+        if self.filename is not None:
+            ImageExporter(self.ci).export(str(self.filename))
         super().closeEvent(*args, **kwargs)
 
 
@@ -162,27 +271,25 @@ class Plotter:
     WINDOW_SIZE = (1200, 800)
     WINDOW_BORDER = True
 
-    MAX_PLOTS = 4
+    MAX_PLOTS = 4  # plots shown at once, more datasets are plotted on further tabs
     MAX_COLS = 2
 
-    MAX_DATA_ITEMS: int = 10  # maximum number of traces in one plot
+    MAX_DATA_ITEMS: int = 10  # maximum number of traces in one plot, else an image
     SCATTER_DOT_SIZE: int = 6
+    POINTS_PER_PIXEL: int = 2  # 1D traces are decimated to this many points per pixel
+    MAX_FPS: float = 10.0  # maximum number of plot updates per second
 
     def __init__(
-        self, interval: float, expt_name: str, datafile, *datasets: Dataset
+        self,
+        interval: float,
+        expt_name: str,
+        datafile,
+        *datasets: Dataset,
+        start: bool = True,
     ) -> None:
-        """ """
-        self.interval = interval
-        self.datasets = datasets
-        self.header, self._header_text = None, expt_name
-        self._expt_name = expt_name
-        self.footer, self._footer_text = None, f"Datafile: {datafile}"
-        self.filename = datafile.parent / f"{datafile.stem}.png"
-
-        if len(datasets) > Plotter.MAX_PLOTS:
-            message = f"Exceeded max number of supported plots: {Plotter.MAX_PLOTS}."
-            logger.error(message)
-            raise PlotterInitializationError(message)
+        """start: if True, open the plotting window in a separate thread, else the
+        caller runs run() e.g. in the main thread of a PlotServer process"""
+        self._set_experiment(interval, expt_name, datafile, datasets)
 
         # Qt objects to be controlled by the Plotter
         self.app, self.layout, self.timer = None, None, None
@@ -194,12 +301,31 @@ class Plotter:
 
         self.stop_expt = False  # to stop experiment if user closes plotting window
 
+        self.fitter = LiveFitter()  # fits are computed off the GUI thread
+        self._tabs = None  # tab bar to switch between pages of plots, if more than one
+        self._page = 0  # index of the page of plots being shown
+        self._last_update = 0.0  # time of the last plot update
+        self._update_time = 0.0  # time spent in the GUI thread by the last plot update
+
         # run() will initialize plots in the plotting window after updating the plotspec
         self.plotspec: dict[Dataset, PlotSpec] = {}
 
         # open the plotting window in a separate thread
-        self.thread = threading.Thread(target=self.run)
-        self.thread.start()
+        self.thread = None
+        if start:
+            self.thread = threading.Thread(target=self.run)
+            self.thread.start()
+
+    def _set_experiment(self, interval, expt_name, datafile, datasets) -> None:
+        """ """
+        self.interval = interval
+        self.datasets = datasets
+        self.header, self._header_text = None, expt_name
+        self._expt_name = expt_name
+        self.footer, self._footer_text = None, f"Datafile: {datafile}"
+        self.filename = None
+        if datafile is not None:
+            self.filename = datafile.parent / f"{datafile.stem}.png"
 
     def run(self) -> None:
         """ """
@@ -212,25 +338,76 @@ class Plotter:
         self.layout.showMaximized()
         self.layout.setWindowTitle("Qcore plotter")
 
+        self._setup_plots()
+
+        # setup crosshair
+        self.layout.scene().sigMouseMoved.connect(self.mouse_moved)
+
+        self.layout.ci.layout.setSpacing(20)
+        self.layout.ci.setContentsMargins(20, 20, 20, 20)
+
+        self.timer = qtc.QTimer()
+        self.timer.timeout.connect(self.update)
+        self.timer.start(int(self.interval * 1000))  # sub-second intervals allowed
+
+        self.app.exec()
+
+    def reset(self, interval: float, expt_name: str, datafile, *datasets: Dataset):
+        """replace the plots in the open window with those of another experiment's
+        datasets, must be called in the GUI thread"""
+        self._set_experiment(interval, expt_name, datafile, datasets)
+        self.timer.stop()
+        self.fitter.shutdown()
+        self.fitter = LiveFitter()
+        for event in (self.new_data_event, self.done_event, self.exit_event):
+            event.clear()
+        self._last_update = 0.0
+
+        self.layout.clear()
+        self.layout.filename = self.filename
+        self._setup_plots()
+        self.timer.start(int(self.interval * 1000))
+
+    def _setup_plots(self) -> None:
+        """ """
         self.plotspec: dict[Dataset, PlotSpec] = {d: PlotSpec(d) for d in self.datasets}
+        self._show_page(0)
+
+    def _show_page(self, page: int) -> None:
+        """create the plot layout of the datasets on the given page, only the plots
+        being shown have pyqtgraph items, which are plotted on the next update"""
+        for spec in self.plotspec.values():
+            if spec.is_built:
+                spec.release()
+        self.layout.clear()
+        self._page = page
+        num_plots = Plotter.MAX_PLOTS
+        datasets = self.datasets[page * num_plots : (page + 1) * num_plots]
+        for dataset in datasets:
+            self.plotspec[dataset].build(dataset)
 
         cmax = Plotter.MAX_COLS
         ht, ft = self._header_text, self._footer_text
         self.header = self.layout.addLabel(ht, colspan=cmax, size="16pt", bold=True)
-
-        # create the plot layout based on the total number of datasets to be plotted
-        if len(self.datasets) == 1:  # to ensure proper alignment of borders
-            plotspec = list(self.plotspec.values())[0]
-            self.layout.addItem(plotspec.plot_item, row=1, col=0, colspan=cmax)
-            r = 2  # row
-            if self.datasets[0].fitfn is not None:
+        r = 1  # row
+        if len(self.datasets) > num_plots:
+            self.layout.addItem(self._get_tabs(), row=r, col=0, colspan=cmax)
+            r += 1
+
+        # create the plot layout based on the number of datasets on this page
+        if len(datasets) == 1:  # to ensure proper alignment of borders
+            plotspec = self.plotspec[datasets[0]]
+            self.layout.addItem(plotspec.plot_item, row=r, col=0, colspan=cmax)
+            r += 1
+            if datasets[0].fitfn is not None:
                 fit_lbl = self.layout.addLabel(row=r, col=0, colspan=cmax, size="10pt")
                 plotspec.fit_label = fit_lbl
                 r += 1
             ftr = self.layout.addLabel(ft, r, 0, colspan=cmax, size="10pt", bold=True)
         else:
-            r, c, has_flbl = 1, 0, False  # row, column, row has fit label
-            for dataset, plotspec in self.plotspec.items():
+            c, has_flbl = 0, False  # column, row has fit label
+            for dataset in datasets:
+                plotspec = self.plotspec[dataset]
                 self.layout.addItem(plotspec.plot_item, row=r, col=c)
                 if dataset.fitfn is not None:
                     fit_lbl = self.layout.addLabel("", r + 1, c, size="10pt")
@@ -246,18 +423,43 @@ class Plotter:
             ftr = self.layout.addLabel(ft, r, 0, colspan=cmax, size="10pt", bold=True)
         self.footer = ftr
 
-        # setup crosshair
-        for spec in self.plotspec.values():
-            spec.plot_item.scene().sigMouseMoved.connect(self.mouse_moved)
-
-        self.layout.ci.layout.setSpacing(20)
-        self.layout.ci.setContentsMargins(20, 20, 20, 20)
-
-        self.timer = qtc.QTimer()
-        self.timer.timeout.connect(self.update)
-        self.timer.start(self.interval * 1000)
+        for dataset in datasets:
+            plotspec = self.plotspec[dataset]
+            # replot decimated 1D traces when their view is zoomed, panned or resized
+            if plotspec.plot_type != "image":
+                view_box = plotspec.plot_item.getViewBox()
+                view_box.sigXRangeChanged.connect(partial(self._view_changed, plotspec))
+                view_box.sigResized.connect(partial(self._view_changed, plotspec))
+            if plotspec.fits:  # fitted while on another page
+                self._draw_fits(dataset, plotspec)
+        self.new_data_event.set()
 
-        self.app.exec()
+    def _get_tabs(self) -> qtw.QGraphicsProxyWidget:
+        """tab bar with a tab per page of plots, it is kept across layout changes"""
+        if self._tabs is None:
+            tab_bar = qtw.QTabBar()
+            tab_bar.setExpanding(False)
+            tab_bar.setElideMode(qtc.Qt.TextElideMode.ElideRight)
+            tab_bar.currentChanged.connect(self._page_changed)
+            self._tabs = qtw.QGraphicsProxyWidget()
+            self._tabs.setWidget(tab_bar)
+
+        tab_bar = self._tabs.widget()
+        tab_bar.blockSignals(True)  # not a page change
+        while tab_bar.count():
+            tab_bar.removeTab(0)
+        num_plots = Plotter.MAX_PLOTS
+        for start in range(0, len(self.datasets), num_plots):
+            names = [d.name for d in self.datasets[start : start + num_plots]]
+            tab_bar.addTab(", ".join(names))
+        tab_bar.setCurrentIndex(self._page)
+        tab_bar.blockSignals(False)
+        return self._tabs
+
+    def _page_changed(self, page: int) -> None:
+        """ """
+        # the tab bar is removed from the layout on rebuilding it, so not while it emits
+        qtc.QTimer.singleShot(0, partial(self._show_page, page))
 
     def plot(self, message, stop=False, exit=False) -> None:
         """ """
@@ -275,36 +477,154 @@ class Plotter:
 
     def update(self):
         """ """
-        if not self.done_event.is_set():
-            if self.new_data_event.is_set():
-                self.new_data_event.clear()
-                self.header.setText(f"{self._header_text}")
-
-                for dataset, spec in self.plotspec.items():
-                    if spec.num_data_items == 1:
-                        self._plot_single(dataset, spec)
-                    else:
-                        self._plot_multiple(dataset, spec)
-
-        else:
+        # new data is plotted at most MAX_FPS times per second, and once more when done
+        is_done, now = self.done_event.is_set(), time.perf_counter()
+        is_due = now - self._last_update >= 1 / Plotter.MAX_FPS
+        if self.new_data_event.is_set() and (is_due or is_done):
+            self.new_data_event.clear()
+            self._last_update = now
+            self._update_plots()
+        self._update_fits()
+
+        if is_done and not self.fitter.is_busy:  # wait for fits of the final data
+            self._update_fits()
+            self.fitter.shutdown()
             if self.exit_event.is_set():
                 self.layout.close()
             self.timer.stop()
 
+    def _update_plots(self) -> None:
+        """replot only the shown datasets whose version or view has changed since they
+        were last plotted, new versions of all datasets are fitted"""
+        start = time.perf_counter()
+        self.header.setText(f"{self._header_text}")
+
+        num_plotted = 0
+        for dataset, spec in self.plotspec.items():
+            version = dataset.version  # read once, the dataset may be updated meanwhile
+            if version > spec.fit_version:
+                spec.fit_version = version
+                self._submit_fits(dataset, spec, version)
+            if not spec.is_built:  # on another page
+                continue
+            if version == spec.version and not spec.view_changed:
+                continue
+            spec.version, spec.view_changed = version, False
+            num_plotted += 1
+            if spec.num_data_items == 1:
+                self._plot_single(dataset, spec)
+            else:
+                self._plot_multiple(dataset, spec)
+
+        self._update_time = time.perf_counter() - start
+        self.footer.setText(self._get_footer_text())
+        logger.debug(
+            f"Updated {num_plotted} of {len(self.plotspec)} plots in "
+            f"{self._update_time * 1e3:.1f} ms."
+        )
+
+    def _submit_fits(self, dataset: Dataset, plotspec: PlotSpec, version: int):
+        """ """
+        if dataset.fitfn is None or plotspec.plot_type == "image":
+            return
+        x = list(dataset.sweep_data.values())[-1]
+        traces = [dataset.avg] if plotspec.num_data_items == 1 else dataset.avg
+        for i, y in enumerate(traces):
+            self.fitter.submit((dataset, i), dataset.fitfn, version, y, x)
+
+    def _update_fits(self) -> None:
+        """plot fit results posted by the fitter, unless newer ones are already shown"""
+        updated = set()
+        for (dataset, i), version, best_fit, best_values in self.fitter.results():
+            spec = self.plotspec[dataset]
+            if i in spec.fits and spec.fits[i][0] > version:
+                continue
+            spec.fits[i] = (version, best_fit, best_values)
+            updated.add(dataset)
+
+        for dataset in updated:
+            spec = self.plotspec[dataset]
+            if spec.num_data_items == 1:
+                _, dataset.best_fit, dataset.fit_params = spec.fits[0]
+            elif len(spec.fits) == spec.num_data_items:
+                fits = sorted(spec.fits.items())
+                dataset.best_fit = np.array([fit[1] for _, fit in fits])
+                dataset.fit_params = [fit[2] for _, fit in fits]
+            if spec.is_built:
+                self._draw_fits(dataset, spec)
+
+    def _draw_fits(self, dataset: Dataset, plotspec: PlotSpec) -> None:
+        """ """
+        x = list(dataset.sweep_data.values())[-1]
+        for i, (_, best_fit, _) in plotspec.fits.items():
+            self._plot_1D(plotspec.plot_fit_items[i], x, best_fit)
+
+        if plotspec.num_data_items == 1:
+            fit_params = {None: plotspec.fits[0][2]}
+        else:
+            y = list(dataset.sweep_data.values())[-2]
+            fit_params = {}
+            for i, (_, _, best_values) in sorted(plotspec.fits.items()):
+                to_round = (float, np.floating)
+                ytxt = f"{y[i]:.5f}" if isinstance(y[i], to_round) else f"{y[i]}"
+                fit_params[ytxt] = best_values
+        plotspec.fit_label.setText(self._get_fit_text(fit_params))
+
+    def _get_fit_text(self, fit_params: dict) -> str:
+        """ """
+        lines = []
+        for label, params in fit_params.items():
+            text = f", ".join(f"{k}: {v:.3g}" for k, v in params.items())
+            lines.append(text if label is None else f"[{label}] {text}")
+        return "<br>".join(lines)
+
+    def _get_footer_text(self) -> str:
+        """ """
+        return f"{self._footer_text} [plot update: {self._update_time * 1e3:.1f} ms]"
+
     def mouse_moved(self, position):
         """ """
         for spec in self.plotspec.values():
             plot_item = spec.plot_item
+            if not spec.is_built:  # on another page
+                continue
             if plot_item.sceneBoundingRect().contains(position):
                 mouse_point = plot_item.vb.mapSceneToView(position)
                 x, y = mouse_point.x(), mouse_point.y()
                 spacing, coord = "&nbsp;" * 128, f"[{x = :.5g}, {y = :.5g}]"
-                text = f"{self._footer_text} <span>{spacing} {coord}</span>"
+                text = f"{self._get_footer_text()} <span>{spacing} {coord}</span>"
                 self.footer.setText(text)
                 cx, cy = spec.crosshair
                 cx.setPos(x)
                 cy.setPos(y)
 
+    def _view_changed(self, plotspec: PlotSpec, *args) -> None:
+        """replot when the user zooms or pans into the data, or zooms back out again"""
+        if not plotspec.is_built:  # signalled while its page is being hidden
+            return
+        is_auto_range = plotspec.plot_item.getViewBox().autoRangeEnabled()[0]
+        if not is_auto_range or plotspec.is_clipped:
+            plotspec.view_changed = True
+            self.new_data_event.set()
+
+    def _get_indices(self, plotspec: PlotSpec, x, y) -> np.ndarray:
+        """indices of the points of a 1D trace to be drawn, the trace is clipped to the
+        x range in view (unless auto-ranging) and decimated to the width of the view"""
+        view_box = plotspec.plot_item.getViewBox()
+        indices = np.arange(len(y))
+        plotspec.is_clipped = not view_box.autoRangeEnabled()[0]
+        if plotspec.is_clipped:
+            xmin, xmax = view_box.viewRange()[0]
+            in_view = (x >= xmin) & (x <= xmax)
+            near_view = in_view.copy()  # keep 1 point on each side to draw lines to
+            near_view[1:] |= in_view[:-1]
+            near_view[:-1] |= in_view[1:]
+            indices = indices[near_view]
+
+        width = view_box.width() or Plotter.WINDOW_SIZE[0]  # zero before first shown
+        max_points = int(width * Plotter.POINTS_PER_PIXEL)
+        return indices[decimate(y[indices], max_points)]
+
     def _plot_single(self, dataset: Dataset, plotspec: PlotSpec):
         """ """
         plot_data_item = plotspec.plot_data_items[0]
@@ -317,51 +637,25 @@ class Plotter:
             self._plot_2D(plot_data_item, x, y, z)
             plotspec.cbar.setLevels(low=np.min(z), high=np.max(z))
         elif plotspec.plot_type in ("scatter", "line"):
-            self._plot_1D(plot_data_item, x, y)
+            idx = self._get_indices(plotspec, x, y)
+            self._plot_1D(plot_data_item, x[idx], y[idx])
             if plotspec.plot_err:
                 plot_err_item = plotspec.plot_err_items[0]
-                self._plot_errorbar(plot_err_item, x, y, dataset.sem)
-
-            if dataset.fitfn is not None:
-                plot_fit_item = plotspec.plot_fit_items[0]
-                best_fit, fit_params = dataset.fitfn(y, x)
-                self._plot_1D(plot_fit_item, x, best_fit)
-                fit_str = f", ".join(f"{k}: {v:.3g}" for k, v in fit_params.items())
-                plotspec.fit_label.setText(fit_str)
-                dataset.best_fit, dataset.fit_params = best_fit, fit_params
+                self._plot_errorbar(plot_err_item, x[idx], y[idx], dataset.sem[idx])
 
     def _plot_multiple(self, dataset: Dataset, plotspec: PlotSpec):
         """ """
         sweep_data = list(dataset.sweep_data.values())
         data = dataset.avg
-        x, y, err = sweep_data[-1], sweep_data[-2], dataset.sem
-        all_best_fits, all_fit_params = [], {}
+        x, err = sweep_data[-1], dataset.sem
         for i in range(plotspec.num_data_items):
             z = data[i]
+            idx = self._get_indices(plotspec, x, z)
             plot_data_item = plotspec.plot_data_items[i]
-            self._plot_1D(plot_data_item, x, z)
+            self._plot_1D(plot_data_item, x[idx], z[idx])
             if plotspec.plot_err:
                 plot_err_item = plotspec.plot_err_items[i]
-                self._plot_errorbar(plot_err_item, x, z, err[i])
-            if dataset.fitfn is not None:
-                plot_fit_item = plotspec.plot_fit_items[i]
-                best_fit, fit_params = dataset.fitfn(z, x)
-                to_round = (float, np.floating)
-                ytxt = f"{y[i]:.5f}" if isinstance(y[i], to_round) else f"{y[i]}"
-                all_fit_params[ytxt] = fit_params
-                all_best_fits.append(best_fit)
-                self._plot_1D(plot_fit_item, x, best_fit)
-
-        dataset.best_fit = np.array(all_best_fits)
-        dataset.fit_params = list(all_fit_params.values())
-
-        fit_str = ""
-        for label, fit_params in all_fit_params.items():
-            fit_str += f"[{label}] "
-            fit_str += f", ".join(f"{k}: {v:.3g}" for k, v in fit_params.items())
-            fit_str += "<br>"
-        if fit_str:
-            plotspec.fit_label.setText(fit_str[:-4])
+                self._plot_errorbar(plot_err_item, x[idx], z[idx], err[i][idx])
 
     def _plot_1D(self, plot, x, y):
         """ """
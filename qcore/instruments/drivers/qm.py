@@ -131,23 +131,48 @@ class QM(Instrument):
         """ """
         return self._status
 
-    def execute(self, qua_program: _ProgramScope, total_count=None):
-        """ """
+    def execute(
+        self,
+        qua_program: _ProgramScope,
+        total_count=None,
+        buffer_depth=2,
+        pacing_tag=None,
+        decimation=None,
+    ):
+        """
+        buffer_depth: number of live result batches that remain valid after fetch()
+        pacing_tag: stream saved once per result, used to count available results
+        decimation: maps tags of streams saved once per block of results to block size
+        """
         if self._config is None or self._qm is None:
             logger.warning("Can't execute program, QM hasn't been opened with a config")
         else:
             # TODO error handling, if exception, set status = False, else set True
             self._job = self._qm.execute(qua_program)
-            self._qrf = QMResultFetcher(self._job.result_handles, total_count)
+            handles = self._job.result_handles
+            args = (total_count, buffer_depth, pacing_tag, decimation)
+            self._qrf = QMResultFetcher(handles, *args)
             return self._job
 
+    def halt(self) -> None:
+        """stop the running job, results saved until then remain available to fetch"""
+        if self._job is not None:
+            self._job.halt()
+
     def is_processing(self) -> bool:
         """ """
         return not self._qrf.is_done_fetching
 
-    def fetch(self) -> tuple[dict[str, np.ndarray], int, int]:
-        """ """
-        return (self._qrf.fetch(), *self._qrf.counts)
+    def fetch(
+        self,
+        block: bool = False,
+        min_new: int = 1,
+        timeout: float = None,
+        poll_interval: float = QMResultFetcher.POLL_INTERVAL,
+    ) -> tuple[dict[str, np.ndarray], int, int]:
+        """see QMResultFetcher.fetch() for blocking mode arguments"""
+        data = self._qrf.fetch(block, min_new, timeout, poll_interval)
+        return (data, *self._qrf.counts)
 
     def set_output_dc_offset_by_element(self, element: str, input: str, offset: float):
         """ """
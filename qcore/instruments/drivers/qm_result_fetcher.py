@@ -1,67 +1,237 @@
 """ """
 
+import time
 from typing import Callable
 
 import numpy as np
 
 from qm.results import MultipleStreamingResultFetcher, SingleStreamingResultFetcher
 
+from qcore.helpers.logger import logger
+
+
+class ResultBuffer:
+    """preallocated ring buffer that live result batches are written into, batches are
+    handed out as views into the buffer so the live fetch loop does not allocate new
+    arrays after the first batch"""
+
+    def __init__(self, depth: int = 2, max_rows: int = None) -> None:
+        """
+        depth: number of most recent batches (including the latest one) guaranteed to
+        remain intact in the buffer, i.e. a view stays valid until 'depth' more batches
+        are written.
+        max_rows: upper bound on the number of rows the buffer will ever hold, typically
+        the total number of results expected from the job.
+        """
+        self.depth = depth
+        self._max_rows = max_rows
+        self._array: np.ndarray = None
+        self._pos: int = 0  # row at which the next batch will be written
+
+    @property
+    def empty(self) -> np.ndarray:
+        """zero-row view of the buffer, None if nothing has been written yet"""
+        return None if self._array is None else self._array[:0]
+
+    @property
+    def capacity(self) -> int:
+        """ """
+        return 0 if self._array is None else len(self._array)
+
+    def write(self, batch: np.ndarray) -> np.ndarray:
+        """copy batch into the buffer and return a view of the written rows"""
+        rows = len(batch)
+        if self._needs_allocation(batch):
+            self._allocate(batch)
+
+        # batches are never split across the end of the buffer, we wrap around instead
+        if self._pos + rows > self.capacity:
+            self._pos = 0
+
+        view = self._array[self._pos : self._pos + rows]
+        view[...] = batch
+        self._pos += rows
+        return view
+
+    def _needs_allocation(self, batch: np.ndarray) -> bool:
+        """ """
+        if self._array is None:
+            return True
+        if batch.shape[1:] != self._array.shape[1:] or batch.dtype != self._array.dtype:
+            return True
+        return self._rows_needed(len(batch)) > self.capacity
+
+    def _rows_needed(self, rows: int) -> int:
+        """one extra batch worth of rows accounts for the space lost while wrapping"""
+        needed = (self.depth + 1) * rows
+        return needed if self._max_rows is None else min(needed, self._max_rows)
+
+    def _allocate(self, batch: np.ndarray) -> None:
+        """ """
+        # views handed out earlier keep the old array alive, so it is safe to replace it
+        rows = max(self._rows_needed(len(batch)), self.capacity)
+        self._array = np.empty((rows, *batch.shape[1:]), dtype=batch.dtype)
+        self._pos = 0
+        logger.debug(f"Allocated result buffer with shape {self._array.shape}.")
+
 
 class QMResultFetcher:
     """ """
 
-    def __init__(self, handle, total_count=None) -> None:
-        """ """
+    POLL_INTERVAL: float = 0.1  # default seconds between result counts while blocking
+
+    def __init__(
+        self,
+        handle,
+        total_count=None,
+        buffer_depth: int = 2,
+        pacing_tag: str = None,
+        decimation: dict[str, int] = None,
+    ) -> None:
+        """
+        pacing_tag: tag of a multiple stream that is saved to exactly once per result,
+        after all other streams have been saved to. If specified, the number of
+        available results is read from this stream alone (one server round trip per
+        fetch) and the stream itself is not fetched. Else, the count is the minimum
+        length of all multiple streams.
+        decimation: maps tags of multiple streams that save one value per block of
+        results to the number of results per block. While the job is running, counts are
+        rounded down to a whole number of blocks so that every batch holds complete
+        blocks only.
+        """
         self._handle = handle
         self._total_count = total_count
+        self._decimation = {} if decimation is None else decimation
+        self._block = int(np.lcm.reduce([1, *self._decimation.values()]))
 
         self._count: int = 0  # current number of results fetched
         self._last_count: int = -1  # only used in live fetch mode to fetch batches
 
         # set result specification for faster live fetching
         self._spec: dict[str, Callable] = {"single": {}, "multiple": {}}
+        self._results = {}  # cache of per-tag result handles
+        self._pacing = None  # result handle of the pacing stream
+        self._buffers: dict[str, ResultBuffer] = {}  # live batches are written here
+        is_live = self._handle.is_processing()
         for tag, result in self._handle:
+            if tag == pacing_tag:
+                self._pacing = result
+                continue
+
+            self._results[tag] = result
             if isinstance(result, SingleStreamingResultFetcher):
                 self._spec["single"][tag] = self._fetch_single
             elif isinstance(result, MultipleStreamingResultFetcher):
                 spec = self._spec["multiple"]
-                is_live = self._handle.is_processing()
                 spec[tag] = self._fetch_batch if is_live else self._fetch_multiple
+                if is_live:
+                    self._buffers[tag] = ResultBuffer(buffer_depth, total_count)
 
     @property
     def is_done_fetching(self) -> bool:
         """flag to indicate job fetch status, True if all results have been fetched"""
-        if self._total_count is None:
-            return self._count == self._last_count and not self._handle.is_processing()
-        else:
-            return self._count == self._total_count and not self._handle.is_processing()
+        if self._handle.is_processing():
+            return False
+        # results may have arrived after the last fetch, recount now that the job has
+        # ended. a halted job stops before the total count is reached
+        return self._count >= self._count_streams()
 
     @property
     def counts(self) -> tuple[int, int]:
         """return (last count, current count) of fetched results during live fetching"""
         return (self._last_count, self._count)
 
-    def fetch(self) -> dict[str, np.ndarray]:
-        """ """
+    def fetch(
+        self,
+        block: bool = False,
+        min_new: int = 1,
+        timeout: float = None,
+        poll_interval: float = POLL_INTERVAL,
+    ) -> dict[str, np.ndarray]:
+        """
+        block: if True, wait until at least 'min_new' new results are available (or the
+        job has ended) before fetching. the QM API offers no notification of new
+        results, so the result count is polled every 'poll_interval' seconds, at the
+        cost of one or two server round trips per poll.
+        timeout: maximum time in seconds to wait for in blocking mode, whatever is
+        available is fetched after the timeout elapses. None means wait indefinitely.
+        """
+        if block:
+            timeout = float("inf") if timeout is None else timeout
+            self._wait(min_new, timeout, poll_interval)
+
         last_count, count = self._count, self._count_results()
         if count == last_count or count == 1:
             return {}
         self._last_count, self._count = last_count, count
-        return {tag: f(tag) for spec in self._spec.values() for tag, f in spec.items()}
+        data = {tag: f(tag) for spec in self._spec.values() for tag, f in spec.items()}
+        if self._buffers and self._buffer_batches(data) == 0:
+            return {}  # streams have not caught up with the count yet
+        return data
+
+    def _wait(self, min_new: int, timeout: float, poll_interval: float) -> None:
+        """poll the result count until 'min_new' new results are available"""
+        target = self._count + min_new
+        if self._total_count is not None:
+            target = min(target, self._total_count)
+        # once all results are counted, only wait for the job to end
+        is_counted = target <= self._count
+
+        deadline = time.perf_counter() + timeout
+        while self._handle.is_processing():
+            if not is_counted and self._count_streams() >= target:
+                return
+            if time.perf_counter() + poll_interval > deadline:
+                logger.debug(f"Timed out waiting for {min_new} new results.")
+                return
+            time.sleep(poll_interval)
 
     def _count_results(self):
         """ """
-        return min(len(self._handle.get(tag)) for tag in self._spec["multiple"])
+        count = self._count_streams()
+        if self._block > 1 and self._handle.is_processing():
+            count -= count % self._block  # only complete blocks while job is running
+        return count
+
+    def _count_streams(self):
+        """ """
+        if self._pacing is not None:
+            return len(self._pacing)
+        counts = []
+        for tag in self._spec["multiple"]:
+            counts.append(len(self._results[tag]) * self._decimation.get(tag, 1))
+        return min(counts)
+
+    def _buffer_batches(self, data) -> int:
+        """write live batches into ring buffers and replace them with buffer views.
+        streams may lag behind the count, so batches are trimmed to the shortest one,
+        the trimmed results are fetched again in the next batch"""
+        last_count, count = self._last_count, self._count
+        for tag in self._buffers:
+            k = self._decimation.get(tag, 1)
+            rows = 0 if data[tag] is None else len(data[tag])
+            if rows < count // k - last_count // k:  # stream lags behind the count
+                count = max(last_count, min(count, (last_count // k + rows) * k))
+        self._count = count
+
+        for tag, buffer in self._buffers.items():
+            k = self._decimation.get(tag, 1)
+            rows = count // k - last_count // k
+            data[tag] = buffer.empty if rows == 0 else buffer.write(data[tag][:rows])
+        return count - last_count
 
     def _fetch_single(self, tag):
         """ """
-        return self._handle.get(tag).fetch_all(flat_struct=True)
+        return self._results[tag].fetch_all(flat_struct=True)
 
     def _fetch_batch(self, tag):
         """ """
-        slc = slice(self._last_count, self._count)
-        return self._handle.get(tag).fetch(slc, flat_struct=True)
+        k = self._decimation.get(tag, 1)
+        slc = slice(self._last_count // k, self._count // k)
+        if slc.start == slc.stop and self._buffers[tag].empty is not None:
+            return self._buffers[tag].empty  # no complete block in this batch
+        return self._results[tag].fetch(slc, flat_struct=True)
 
     def _fetch_multiple(self, tag):
         """ """
-        return self._handle.get(tag).fetch_all(flat_struct=True)
+        return self._results[tag].fetch_all(flat_struct=True)
@@ -7,6 +7,11 @@ from scipy.signal.windows import hann
 
 # the 'data' argument must be a sequence of np arrays to be unpacked by the data_fn
 
+# data_fns that act on each repetition (row along the averaging axis) independently,
+# such that derived datasets can evaluate them on each newly arrived batch of raw data
+# alone. all other data_fns are only evaluated on the averages of their inputs.
+INCREMENTAL_DATAFNS = ("mag", "phase", "fft")
+
 
 def mag(data):
     """absolute value of two inputs x and y"""
@@ -21,7 +21,18 @@ def create_params(**kwargs):
     return lmfit.create_params(**params)
 
 
-def atan(y, x):
+def _fit(model: Model, data, params, warm_start: dict = None, **independent_vars):
+    """fit the model starting from the best values of a previous fit (e.g. of the same
+    trace with fewer averages) where given and within bounds, instead of the guessed
+    initial values"""
+    for name, value in (warm_start or {}).items():
+        param = params.get(name)
+        if param is not None and param.vary and param.min <= value <= param.max:
+            param.set(value=value)
+    return model.fit(data, params, **independent_vars)
+
+
+def atan(y, x, warm_start=None):
     """ """
 
     def fn(x, fr, Ql, theta, sign=1):
@@ -47,11 +58,11 @@ def atan(y, x):
         params["sign"].set(vary=False)
         return params
 
-    result = Model(fn).fit(y, params(y, x), x=x)
+    result = _fit(Model(fn), y, params(y, x), warm_start, x=x)
     return result.best_fit, result.best_values
 
 
-def cohstate_decay(y, x):
+def cohstate_decay(y, x, warm_start=None):
     """ """
 
     def fn(x, amp, alpha0, tau, ofs, n):
@@ -74,11 +85,11 @@ def cohstate_decay(y, x):
         tau = x[-1] / 5
         return create_params(n=0, amp=amp, ofs=ofs, alpha0=1.0, tau=tau)
 
-    result = Model(fn).fit(y, params(y, x), x=x)
+    result = _fit(Model(fn), y, params(y, x), warm_start, x=x)
     return result.best_fit, result.best_values
 
 
-def displacement_cal(y, x):
+def displacement_cal(y, x, warm_start=None):
     """ """
 
     def fn(x, dispscale, ofs, amp, n):
@@ -94,11 +105,11 @@ def displacement_cal(y, x):
         ofs = np.max(y) if (amp < 0) else np.min(y)
         return create_params(dispscale=1.0, ofs=ofs, amp=amp, n=0)
 
-    result = Model(fn).fit(y, params(y, x), x=x)
+    result = _fit(Model(fn), y, params(y, x), warm_start, x=x)
     return result.best_fit, result.best_values
 
 
-def double_gaussian_2dhist(z, y, x):
+def double_gaussian_2dhist(z, y, x, warm_start=None):
     """ """
 
     def fn(y, x, y0, x0, y1, x1, a0, a1, ofs, sigma=2):
@@ -132,11 +143,12 @@ def double_gaussian_2dhist(z, y, x):
 
         return create_params(y0=y0, x0=x0, y1=y1, x1=x1, a0=a0, a1=a1, sigma=sigma)
 
-    result = Model(fn, independent_vars=["x", "y"]).fit(z, params(z, y, x), y=y, x=x)
+    model = Model(fn, independent_vars=["x", "y"])
+    result = _fit(model, z, params(z, y, x), warm_start, y=y, x=x)
     return result.best_fit, result.best_values
 
 
-def exp_decay(y, x):
+def exp_decay(y, x, warm_start=None):
     """ """
 
     def fn(x, A, tau, ofs):
@@ -151,11 +163,11 @@ def exp_decay(y, x):
         tau_dict = {"value": tau, "min": 0, "max": 100 * tau}
         return create_params(A=y[0], tau=tau_dict, ofs=ofs)
 
-    result = Model(fn).fit(y, params(y, x), x=x)
+    result = _fit(Model(fn), y, params(y, x), warm_start, x=x)
     return result.best_fit, result.best_values
 
 
-def exp_decay_sine(y, x):
+def exp_decay_sine(y, x, warm_start=None):
     """ """
 
     def fn(x, amp=1, f0=0.05, phi=np.pi / 4, ofs=0, tau=0.5):
@@ -167,11 +179,11 @@ def exp_decay_sine(y, x):
         params.add("tau", value=np.average(x), min=0, max=10 * x[-1])
         return params
 
-    result = Model(fn).fit(y, params(y, x), x=x)
+    result = _fit(Model(fn), y, params(y, x), warm_start, x=x)
     return result.best_fit, result.best_values
 
 
-def gaussian(y, x):
+def gaussian(y, x, warm_start=None):
     """ """
 
     def fn(x, x0, sig, ofs, amp):
@@ -192,11 +204,11 @@ def gaussian(y, x):
             amp={"value": y[peak_idx] - ofs, "min": -3 * yrange, "max": 3 * yrange},
         )
 
-    result = Model(fn).fit(y, params(y, x), x=x)
+    result = _fit(Model(fn), y, params(y, x), warm_start, x=x)
     return result.best_fit, result.best_values
 
 
-def gaussian2d_symmetric(z, y, x):
+def gaussian2d_symmetric(z, y, x, warm_start=None):
     """ """
 
     def fn(y, x, y0=0, x0=0, sigma=1, area=1, ofs=0):
@@ -231,17 +243,19 @@ def gaussian2d_symmetric(z, y, x):
             ofs=zofs,
         )
 
-    result = Model(fn, independent_vars=["x", "y"]).fit(z, params(z, y, x), y=y, x=x)
+    model = Model(fn, independent_vars=["x", "y"])
+    result = _fit(model, z, params(z, y, x), warm_start, y=y, x=x)
     return result.best_fit, result.best_values
 
 
-def linear(y, x):
+def linear(y, x, warm_start=None):
     """ """
-    result = LinearModel.fit(y, x=x)
+    model = LinearModel()
+    result = _fit(model, y, model.guess(y, x=x), warm_start, x=x)
     return result.best_fit, result.best_values
 
 
-def lorentzian(y, x, return_params=False):
+def lorentzian(y, x, return_params=False, warm_start=None):
     """ """
 
     def fn(x, fr, ofs, height, fwhm):
@@ -264,11 +278,11 @@ def lorentzian(y, x, return_params=False):
     fit_params = params(y, x)
     if return_params:
         return fit_params
-    result = Model(fn).fit(y, fit_params, x=x)
+    result = _fit(Model(fn), y, fit_params, warm_start, x=x)
     return result.best_fit, result.best_values
 
 
-def lorentzian_asymmetric(y, x):
+def lorentzian_asymmetric(y, x, warm_start=None):
     """ """
 
     def fn(x, fr, ofs, height, fwhm, phi):
@@ -285,11 +299,11 @@ def lorentzian_asymmetric(y, x):
         fr.set(value=x[fr_idx])
         return params
 
-    result = Model(fn).fit(y, params(y, x), x=x)
+    result = _fit(Model(fn), y, params(y, x), warm_start, x=x)
     return result.best_fit, result.best_values
 
 
-def sine(y, x, return_params=False):
+def sine(y, x, return_params=False, warm_start=None):
     """ """
 
     def fn(x, f0, ofs, amp, phi):
@@ -312,10 +326,12 @@ def sine(y, x, return_params=False):
     fit_params = params(y, x)
     if return_params:
         return fit_params
-    result = Model(fn).fit(y, fit_params, x=x)
+    result = _fit(Model(fn), y, fit_params, warm_start, x=x)
     return result.best_fit, result.best_values
 
 
 FITFN_MAP = {
-    k: v for k, v in locals().items() if not k == "isfunction" and isfunction(v)
+    k: v
+    for k, v in locals().items()
+    if not k == "isfunction" and not k.startswith("_") and isfunction(v)
 }
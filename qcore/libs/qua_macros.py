@@ -1,6 +1,7 @@
 """ library of QUA macros, wrappers for QUA """
 
 from qm import qua
+from qm.qua import FUNCTIONS
 from qm.qua.lib import Cast
 from qm.qua._dsl import _Variable
 
@@ -41,7 +42,19 @@ class StreamProcessingError(Exception):
 class QuaVariable:
     """ """
 
-    def __init__(self, dtype, stream=False, value=None, tag=None, buffer=None) -> None:
+    RAW_MODES = ("all", "decimated", "none")
+
+    def __init__(
+        self,
+        dtype,
+        stream=False,
+        value=None,
+        tag=None,
+        buffer=None,
+        raw="all",
+        decimation=None,
+        second_moment=False,
+    ) -> None:
         """ """
         super().__init__()
         self.dtype = dtype
@@ -50,6 +63,15 @@ class QuaVariable:
         self.stream = stream
         self.buffer = buffer
 
+        # raw data streaming mode, "all" to save every shot, "decimated" to save the
+        # averages of blocks of 'decimation' consecutive shots, "none" to only save the
+        # running average
+        self.raw = raw
+        self.decimation = decimation
+
+        # set to True to also save the running average of the squared data
+        self.second_moment = second_moment
+
         self.nominal_value = value
         self.tag = tag
         self.qua_variable = None
@@ -82,18 +104,29 @@ class QuaVariable:
         if not self.stream:
             return
 
+        if not self.is_adc_trace and hasattr(self, "sweep_points"):  # is sweep
+            self.qua_stream.buffer(*self.buffer).save(self.tag)
+            return
+
+        if self.raw == "all":
+            self._get_stream().save_all(self.tag)
+        elif self.raw == "decimated":
+            blocks = self._get_stream().buffer(self.decimation)
+            blocks.map(FUNCTIONS.average(0)).save_all(self.tag)
+        self._get_stream().average().save(f"{self.tag}_avg")
+        if self.second_moment:  # square elementwise by zipping the stream with itself
+            squares = self._get_stream().zip(self._get_stream())
+            squares.map(FUNCTIONS.tuple_multiply()).average().save(f"{self.tag}_avg2")
+
+    def _get_stream(self):
+        """return a new result stream to be processed for an adc trace or dataset"""
         adc_trace = self.is_adc_trace
         if adc_trace == 1:
-            self.qua_stream.input1().save_all(self.tag)
-            self.qua_stream.input1().average().save(f"{self.tag}_avg")
+            return self.qua_stream.input1()
         elif adc_trace == 2:
-            self.qua_stream.input2().save_all(self.tag)
-            self.qua_stream.input2().average().save(f"{self.tag}_avg")
-        elif not adc_trace and hasattr(self, "sweep_points"):  # is sweep
-            self.qua_stream.buffer(*self.buffer).save(self.tag)
+            return self.qua_stream.input2()
         elif not adc_trace:  # is dataset
-            self.qua_stream.buffer(*self.buffer).save_all(self.tag)
-            self.qua_stream.buffer(*self.buffer).average().save(f"{self.tag}_avg")
+            return self.qua_stream.buffer(*self.buffer)
         else:
             message = f"Failed to process stream for qua variable '{self.tag}'."
             logger.error(message)
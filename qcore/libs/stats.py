@@ -0,0 +1,51 @@
+""" library of running statistics for streamed data """
+
+import numpy as np
+
+
+class RunningStats:
+    """Running count, mean and sum of squared deviations from the mean (m2) of data
+    arriving in batches along axis 0.
+
+    Batches are merged with the parallel algorithm of Chan et al., which is numerically
+    stable and costs O(batch) per update regardless of how much data has been merged.
+    """
+
+    def __init__(self, shape: tuple[int] = ()) -> None:
+        """shape: shape of a single sample, i.e. of the batch without its first axis"""
+        self.count: int = 0
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+
+    def update(self, batch: np.ndarray) -> None:
+        """merge a batch of samples stacked along axis 0"""
+        count = len(batch)
+        if count == 0:
+            return
+        mean = np.mean(batch, axis=0)
+        m2 = np.sum(np.square(batch - mean), axis=0)
+        self.merge(count, mean, m2)
+
+    def merge(self, count: int, mean: np.ndarray, m2: np.ndarray) -> None:
+        """merge the statistics of 'count' samples with given mean and m2"""
+        if count == 0:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * (count / total)
+        self.m2 = self.m2 + m2 + np.square(delta) * (self.count * count / total)
+        self.count = total
+
+    @property
+    def var(self) -> np.ndarray:
+        """unbiased sample variance, zero until at least two samples are merged"""
+        if self.count < 2:
+            return np.zeros_like(self.m2)
+        return self.m2 / (self.count - 1)
+
+    @property
+    def sem(self) -> np.ndarray:
+        """standard error of the mean"""
+        if self.count < 2:
+            return np.zeros_like(self.m2)
+        return np.sqrt(self.var / self.count)
@@ -0,0 +1,30 @@
+import pytest
+
+from qcore.variables.datasets import Dataset
+from qcore.variables.sweeps import Sweep
+
+
+@pytest.fixture
+def make_sweeps():
+    """makes the averaging sweep 'N' with given repetitions and a 3 point sweep 'freq'"""
+
+    def make(repetitions: int = 10) -> tuple[Sweep, Sweep]:
+        reps = Sweep(name="N", start=1, stop=repetitions, step=1, dtype=int)
+        freq = Sweep(name="freq", points=[1.0, 2.0, 3.0], units="Hz")
+        for sweep in (reps, freq):
+            sweep.initialize()
+        return reps, freq
+
+    return make
+
+
+@pytest.fixture
+def make_dataset(make_sweeps):
+    """makes a Dataset whose axes are new 'N' and 'freq' sweeps"""
+
+    def make(name: str = "I", repetitions: int = 10, **kwargs) -> Dataset:
+        dataset = Dataset(name, **kwargs)
+        dataset.initialize(list(make_sweeps(repetitions)))
+        return dataset
+
+    return make
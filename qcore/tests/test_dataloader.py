@@ -0,0 +1,74 @@
+import h5py
+import numpy as np
+
+from qcore.helpers.dataloader import Dataloader
+from qcore.helpers.datasaver import Datasaver
+from qcore.variables.sweeps import Sweep
+
+
+def test_load_what_datasaver_saved(tmp_path, make_dataset):
+    dataset = make_dataset(save=True, units="V")
+    reps, freq = dataset.axes
+
+    path = tmp_path / "data.h5"
+    data = np.random.default_rng(seed=0).random(dataset.shape)
+    with Datasaver(path, dataset, batch_size=5) as datasaver:
+        datasaver.save_metadata({"instruments": {"lo": {"frequency": 5e9}}})
+        for sweep in (reps, freq):
+            datasaver.save_data(sweep)
+        for start in range(0, 6, 5):  # the last repetitions are not saved
+            dataset.data = data[start : start + 5]
+            dataset.index = (slice(start, start + 5), ...)
+            datasaver.save_data(dataset)
+
+    with Dataloader(path) as loader:
+        assert loader.datasets == ["I"] and loader.sweeps == ["N", "freq"]
+        assert loader.metadata["instruments"] == {"lo": {"frequency": 5e9}}
+        loaded = loader.load_dataset("I")
+        assert loaded.units == "V" and loaded.shape == (10, 3)
+        assert [ax.name for ax in loaded.axes] == ["N", "freq"]
+        assert np.array_equal(loaded.data[()], data[:10])
+
+
+def test_load_averages_saved_per_outer_sweep_point(tmp_path, make_dataset):
+    dataset = make_dataset(save=True, raw="none")
+    freq = dataset.axes[1]
+    flux = Sweep(name="flux", points=[0.0, 0.5])
+    flux.initialize()
+
+    path = tmp_path / "data.h5"
+    avgs = np.random.default_rng(seed=0).random((2, 3))
+    with Datasaver(path, dataset, outer=flux) as datasaver:
+        for sweep in (freq, flux):  # the averaging axis is not saved
+            datasaver.save_data(sweep)
+        for point, count in enumerate((10, 7)):
+            datasaver.point = point
+            dataset.count, dataset.data, dataset.index = count, avgs[point], ...
+            datasaver.save_data(dataset)
+
+    with Dataloader(path) as loader:
+        loaded = loader.load_dataset("I")
+        assert [getattr(ax, "name", ax) for ax in loaded.axes] == ["flux", 10, "freq"]
+        assert loaded.count == 10  # the most repetitions of any outer sweep point
+        assert np.array_equal(loaded.avg[()], avgs)
+
+
+def test_mmap_falls_back_to_h5py_for_datasaver_files(tmp_path, make_dataset):
+    dataset = make_dataset(save=True)
+    data = np.random.default_rng(seed=0).random(dataset.shape)
+    saved = tmp_path / "saved.h5"
+    with Datasaver(saved, dataset) as datasaver:
+        for sweep in dataset.axes:
+            datasaver.save_data(sweep)
+        dataset.data, dataset.index = data, ...
+        datasaver.save_data(dataset)
+    contiguous = tmp_path / "contiguous.h5"
+    with h5py.File(contiguous, "w") as file:
+        file.create_dataset("I", data=data)
+
+    with Dataloader(saved, mmap=True) as loader:  # all datasets are chunked
+        array = loader.get_array("I")
+        assert isinstance(array, h5py.Dataset) and np.array_equal(array[()], data)
+    with Dataloader(contiguous, mmap=True) as loader:
+        array = loader.get_array("I")
+        assert isinstance(array, np.memmap) and np.array_equal(array, data)
@@ -0,0 +1,71 @@
+import h5py
+import numpy as np
+
+from qcore.helpers.datasaver import Datasaver, plan_chunks
+
+
+def test_plan_chunks_1d():
+    assert plan_chunks((1000,), 8, rows=10, target_bytes=1024) == (120,)  # 12 batches
+    assert plan_chunks((1000,), 8, target_bytes=1024) == (128,)
+    assert plan_chunks((50,), 8, rows=10, target_bytes=1024) == (50,)  # fits whole
+    assert plan_chunks((10,), 2**21, rows=1) == (1,)  # one element exceeds the target
+
+
+def test_plan_chunks_2d():
+    # chunks span whole batches along the first axis and keep the second axis whole
+    assert plan_chunks((100, 50), 8, rows=4, target_bytes=4096) == (8, 50)
+    assert plan_chunks((100, 50), 8, rows=20, target_bytes=4096) == (10, 50)
+    assert plan_chunks((100, 1000), 8, rows=4, target_bytes=4096) == (1, 512)
+
+
+def test_plan_chunks_3d():
+    shape = (100, 64, 64)
+    assert plan_chunks(shape, 8, rows=1, target_bytes=2**16) == (2, 64, 64)
+    # axes are split from the outermost inwards, the innermost one is kept whole
+    assert plan_chunks(shape, 8, rows=10, target_bytes=2**14) == (1, 32, 64)
+    assert plan_chunks(shape, 8, target_bytes=2**8) == (1, 1, 32)
+
+
+def test_coalesce_merges_adjacent_writes_in_order(tmp_path, make_dataset):
+    dataset = make_dataset(repetitions=20, save=True)
+    datasaver = Datasaver(tmp_path / "data.h5", dataset)
+    a, b, c = np.zeros((5, 3)), np.ones((5, 3)), np.full((5, 3), 2.0)
+
+    writes = []
+    datasaver._coalesce(writes, (slice(0, 5), ...), a)
+    datasaver._coalesce(writes, (slice(5, 10), ...), b)
+    assert len(writes) == 1 and writes[0][0] == (slice(0, 10), ...)
+    assert writes[0][1][0] is a and writes[0][1][1] is b  # concatenated in order
+
+    datasaver._coalesce(writes, (slice(15, 20), ...), c)  # leaves a gap
+    datasaver._coalesce(writes, (slice(10, 15), ...), c)  # before the last write
+    assert [index for index, _ in writes] == [
+        (slice(0, 10), ...),
+        (slice(15, 20), ...),
+        (slice(10, 15), ...),
+    ]
+
+    datasaver._coalesce(writes, ..., np.zeros((20, 3)))  # overwrites all of them
+    assert len(writes) == 1 and writes[0][0] is ...
+
+
+def test_write_behind_flushes_pending_writes_on_exit(tmp_path, make_dataset):
+    dataset = make_dataset(repetitions=20, save=True, compression="gzip")
+    path = tmp_path / "data.h5"
+    data = np.random.default_rng(seed=0).random(dataset.shape)
+    # budgets are never reached, so all writes are still pending on exit
+    kwargs = {"write_behind": True, "flush_interval": 100, "flush_bytes": 2**30}
+    with Datasaver(path, dataset, batch_size=5, **kwargs) as datasaver:
+        for sweep in dataset.axes:
+            datasaver.save_data(sweep)
+        for start in (5, 0, 10):  # out of order, not all coalesced
+            dataset.count = 15
+            dataset.data = data[start : start + 5]
+            dataset.index = (slice(start, start + 5), ...)
+            datasaver.save_data(dataset)
+        assert datasaver._writer.is_alive()
+
+    with h5py.File(path, "r") as file:
+        assert file["I"].compression == "gzip"
+        assert file["I"].attrs["count"] == 15
+        assert np.array_equal(file["I"][()], data[:15])
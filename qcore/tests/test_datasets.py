@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+
+def stream(dataset, shots, batch_size=50):
+    """update the dataset with shots in batches, as Experiment does while running"""
+    for start in range(0, len(shots), batch_size):
+        stop = start + batch_size
+        dataset.update((shots[start:stop], shots[:stop].mean(axis=0)), start, stop)
+
+
+def test_reset_starts_statistics_of_next_sweep_point(make_dataset):
+    dataset = make_dataset(repetitions=200)
+    rng = np.random.default_rng(seed=0)
+
+    stream(dataset, rng.normal(0.0, 1.0, (200, 3)))  # first outer sweep point
+    assert dataset.std == pytest.approx(1.0, rel=0.2)
+
+    dataset.reset()
+    assert dataset.count == 0 and np.all(dataset.sem == 0)
+    shots = rng.normal(10.0, 0.01, (200, 3))  # second outer sweep point
+    stream(dataset, shots)
+    assert dataset.count == 200
+    assert np.allclose(dataset.avg, shots.mean(axis=0))
+    assert np.allclose(dataset.std, shots.std(axis=0, ddof=1))  # about 0.01
+    assert np.allclose(dataset.sem, shots.std(axis=0, ddof=1) / np.sqrt(200))
+
+
+def test_incremental_datafn_averages_what_its_sem_describes(make_dataset):
+    i, q = make_dataset("I", repetitions=200), make_dataset("Q", repetitions=200)
+    mag = make_dataset("A", repetitions=200, datafn="mag", inputs=["I", "Q"])
+    rng = np.random.default_rng(seed=0)
+    shots_i, shots_q = rng.normal(1.0, 0.5, (200, 3)), rng.normal(0.0, 0.5, (200, 3))
+
+    for start in range(0, 200, 50):
+        stop = start + 50
+        i.update((shots_i[start:stop], shots_i[:stop].mean(axis=0)), start, stop)
+        q.update((shots_q[start:stop], shots_q[:stop].mean(axis=0)), start, stop)
+        mag.update([i, q], start, stop)
+
+    shots = np.hypot(shots_i, shots_q)
+    assert np.allclose(mag.avg, shots.mean(axis=0))
+    assert np.allclose(mag.sem, shots.std(axis=0, ddof=1) / np.sqrt(200))
+    # the magnitude of the averages is biased low by the noise
+    assert np.all(np.hypot(i.avg, q.avg) < mag.avg - 3 * mag.sem)
@@ -0,0 +1,54 @@
+import numpy as np
+
+from qcore.experiment import Experiment, ExperimentManager
+from qcore.helpers.datasaver import Datasaver
+
+
+def test_decimated_dataset_does_not_converge_before_its_sem_is_known(make_dataset):
+    dataset = make_dataset(repetitions=100, raw="decimated", decimation=10)
+    experiment = Experiment.__new__(Experiment)  # no stage or QM needed to check
+    experiment.datasets = {"I": dataset}
+    experiment.stop_args = {"target_sem": {"I": 0.1}, "min_repetitions": 10}
+
+    blocks = np.random.default_rng(seed=0).normal(0.0, 0.01, (10, 3))
+    dataset.update((blocks[:1], blocks[:1].mean(axis=0)), 0, 10)  # one block
+    assert dataset.stats_count == 1 and np.all(dataset.sem == 0)
+    assert not experiment._has_converged(10)
+
+    dataset.update((blocks[1:3], blocks[:3].mean(axis=0)), 10, 30)
+    assert dataset.stats_count == 3
+    assert experiment._has_converged(30)
+
+
+def test_run_after_resume_starts_from_scratch(tmp_path, monkeypatch, make_dataset):
+    dataset = make_dataset(repetitions=100, save=True)
+    path = tmp_path / "interrupted.h5"
+    data = np.random.default_rng(seed=0).random((30, 3))
+    with Datasaver(path, dataset) as datasaver:
+        for sweep in dataset.axes:
+            datasaver.save_data(sweep)
+        dataset.count, dataset.data, dataset.index = 30, data, (slice(0, 30), ...)
+        datasaver.save_data(dataset)
+
+    experiment = Experiment.__new__(Experiment)  # no stage or QM needed to run
+    experiment.name, experiment._folder = "expt", tmp_path
+    experiment.sweeps = dict(zip(("N", "freq"), dataset.axes))
+    experiment.datasets, experiment.repetitions = {"I": dataset}, 100
+    experiment._manager, experiment._snapshots = ExperimentManager(), {}
+    experiment._filepath, experiment._offset = None, 0
+
+    runs = []  # state each run of the qua sweeps starts with
+
+    def run_qua_sweeps():
+        runs.append((experiment._filepath, experiment._offset, dataset._offset))
+
+    monkeypatch.setattr(experiment, "_run_qua_sweeps", run_qua_sweeps)
+    experiment.resume(path)
+    assert runs[0] == (path, 30, 30)
+    assert experiment._offset == 0 and experiment._filepath is None
+    assert dataset._offset == 0 and dataset._prior_avg is None
+
+    experiment.run()
+    filepath, offset, dataset_offset = runs[1]
+    assert filepath != path and filepath.parent.parent == tmp_path / "data"
+    assert offset == 0 and dataset_offset == 0
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from qcore.experiment import DatasetInitializationError, ExperimentManager
+from qcore.helpers.datasaver import Datasaver
+from qcore.variables.datasets import Dataset
+
+
+def test_restore_datasets_after_crash(tmp_path, make_dataset):
+    dataset = make_dataset(repetitions=100, save=True)
+    reps, freq = dataset.axes
+
+    path = tmp_path / "crashed.h5"
+    data = np.random.default_rng(seed=0).random(dataset.shape)
+    datasaver = Datasaver(path, dataset, batch_size=10)
+    datasaver.__enter__()
+    for sweep in (reps, freq):
+        datasaver.save_data(sweep)
+    for start in range(0, 30, 10):
+        dataset.count = start + 10
+        dataset.data = data[start : start + 10]
+        dataset.index = (slice(start, start + 10), ...)
+        datasaver.save_data(dataset)
+    datasaver._file.close()  # the process crashes, __exit__() is never called
+
+    restored = Dataset("I", save=True)
+    restored.initialize([reps, freq])
+    sweeps = {"N": reps, "freq": freq}
+    count = ExperimentManager().restore_datasets(path, {"I": restored}, sweeps)
+
+    assert count == 30
+    assert np.allclose(restored.avg, np.mean(data[:30], axis=0))
+    assert np.allclose(restored.sem, np.std(data[:30], axis=0, ddof=1) / np.sqrt(30))
+
+
+def test_order_datasets_with_diamond_dependency():
+    datasets = {
+        "I": Dataset("I"),
+        "Q": Dataset("Q"),
+        "A": Dataset("A", inputs=["I", "Q"]),
+        "B": Dataset("B", inputs=["A"]),
+        "C": Dataset("C", inputs=["A", "I"]),
+        "D": Dataset("D", inputs=["B", "C"]),
+    }
+    levels = ExperimentManager().order_datasets(datasets)
+    assert [sorted(level) for level in levels] == [["A"], ["B", "C"], ["D"]]
+
+
+def test_order_datasets_with_cycle():
+    datasets = {
+        "I": Dataset("I"),
+        "A": Dataset("A", inputs=["I", "C"]),
+        "B": Dataset("B", inputs=["A"]),
+        "C": Dataset("C", inputs=["B"]),
+    }
+    with pytest.raises(DatasetInitializationError, match="cyclic"):
+        ExperimentManager().order_datasets(datasets)
@@ -1,6 +1,8 @@
 from datetime import date
 from pathlib import Path
 
+import h5py
+
 from qcore.helpers.datasaver import Datasaver
 
 
@@ -26,5 +28,45 @@ def test_save_dict_as_metadata():
         })
 
 
+def test_save_metadata_links_identical_snapshots(tmp_path):
+    lo = {"name": "lo", "frequency": 5e9, "power": 10.0}
+    rr = {"name": "rr", "int_freq": -50e6}
+    reference = tmp_path / "reference.h5"
+    with Datasaver(reference) as ds:
+        ds.save_metadata({"instruments": {"lo": lo}, "modes": {"rr": rr}})
+
+    path = tmp_path / "diff.h5"
+    with Datasaver(path, reference=reference) as ds:
+        changed = {**rr, "int_freq": -60e6}
+        ds.save_metadata({"instruments": {"lo": lo}, "modes": {"rr": changed}})
+        ds.save_metadata({None: {"save_args": {"reference": reference}}})
+
+    with h5py.File(path, "r") as file:
+        link = file["instruments"].get("lo", getlink=True)
+        assert isinstance(link, h5py.ExternalLink)
+        assert file["instruments/lo"].attrs["frequency"] == 5e9
+        assert isinstance(file["modes"].get("rr", getlink=True), h5py.HardLink)
+        assert file["modes/rr"].attrs["int_freq"] == -60e6
+        assert file["save_args"].attrs["reference"] == str(reference)
+
+
+def test_save_metadata_per_outer_sweep_point(tmp_path):
+    lo = {"name": "lo", "frequency": 5e9, "power": 10.0}
+    path = tmp_path / "points.h5"
+    with Datasaver(path) as ds:
+        ds.save_metadata({"instruments": {"lo": lo}})
+        ds.save_metadata({"instruments": {"lo": lo}}, group="points/1")
+        changed = {**lo, "frequency": 6e9}
+        ds.save_metadata({"instruments": {"lo": changed}}, group="points/2")
+        ds.save_metadata({"instruments": {"lo": changed}}, group="points/3")
+
+    with h5py.File(path, "r") as file:
+        for i, target in ((1, "/instruments/lo"), (3, "/points/2/instruments/lo")):
+            link = file[f"points/{i}/instruments"].get("lo", getlink=True)
+            assert isinstance(link, h5py.SoftLink) and link.path == target
+        assert file["points/1/instruments/lo"].attrs["frequency"] == 5e9
+        assert file["points/3/instruments/lo"].attrs["frequency"] == 6e9
+
+
 if __name__ == '__main__':
     test_save_dict_as_metadata()
@@ -0,0 +1,92 @@
+import time
+
+import numpy as np
+import pytest
+
+from qcore.helpers import fetcher as fetcher_module
+from qcore.helpers.fetcher import AdaptiveInterval, Fetcher
+
+
+class FakeQM:
+    """running QM whose job saves 'num_batches' batches of 10 results, one per fetch"""
+
+    def __init__(self, num_batches=None, error=None):
+        self.num_batches = num_batches  # None to keep the job running until stopped
+        self.error = error  # raised by fetch()
+        self.count = 0
+
+    def is_processing(self):
+        return self.num_batches is None or self.count < 10 * self.num_batches
+
+    def fetch(self, *args):
+        if self.error is not None:
+            raise self.error
+        last_count, self.count = self.count, self.count + 10
+        return {"I": np.arange(last_count, self.count)}, last_count, self.count
+
+
+def test_fetcher_ends_with_done_sentinel():
+    fetcher = Fetcher(FakeQM(num_batches=3), interval=0.01)
+    fetcher.start()
+
+    batches = []
+    while not fetcher.is_done:
+        batch = fetcher.get(timeout=1)
+        if batch is not None:
+            batches.append(batch)
+    fetcher.stop()
+
+    counts = [(prev, count) for _, prev, count in batches]
+    assert counts == [(0, 10), (10, 20), (20, 30)]
+    assert fetcher.num_batches == 3 and fetcher.queue.empty()
+
+
+def test_fetcher_reraises_error_in_consumer():
+    fetcher = Fetcher(FakeQM(error=RuntimeError("lost connection")), interval=0.01)
+    fetcher.start()
+    with pytest.raises(RuntimeError, match="lost connection"):
+        fetcher.get(timeout=1)
+    assert fetcher.is_done
+    fetcher.stop()
+
+
+def test_fetcher_queue_is_bounded():
+    fetcher = Fetcher(FakeQM(), interval=0.01, queue_size=2)
+    fetcher.start()
+    deadline = time.perf_counter() + 5
+    while fetcher.num_full == 0 and time.perf_counter() < deadline:
+        time.sleep(0.01)
+
+    assert fetcher.queue.full() and fetcher.num_full > 0  # producer is held back
+    assert fetcher.num_batches == 2
+    fetcher.stop()  # must not hang while the queue is full
+    assert not fetcher.thread.is_alive() and fetcher.queue.qsize() == 2
+
+
+class FakeTime:
+    """stands in for the time module to simulate the time between fetches"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def perf_counter(self):
+        return self.now
+
+
+def test_adaptive_interval_converges_to_arrival_rate(monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(fetcher_module, "time", clock)
+    adaptive = AdaptiveInterval(0.1, target_batch=100, min_interval=0.05)
+
+    rate, count, interval = 400, 0, adaptive.update(0)
+    for _ in range(20):
+        clock.now += interval
+        count += rate * interval
+        interval = adaptive.update(count)
+    assert adaptive.rate == pytest.approx(rate)
+    assert interval == pytest.approx(100 / rate)  # each fetch returns target_batch
+
+    for _ in range(10):  # results stop arriving, back off up to max_interval
+        clock.now += interval
+        interval = adaptive.update(count)
+    assert interval == adaptive.max_interval
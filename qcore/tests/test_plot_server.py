@@ -0,0 +1,75 @@
+import os
+import socket
+import threading
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")  # before Qt is started
+
+import numpy as np
+from PyQt6 import QtCore as qtc
+
+from qcore.helpers.plot_server import PlotClient, PlotServer
+from qcore.helpers.plotter import PlotterInitializationError
+
+
+def get_free_port():
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+def connect(*args, timeout=10):
+    """the server may still be starting up"""
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            return PlotClient(*args)
+        except PlotterInitializationError:
+            if time.perf_counter() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def test_authkey_is_generated_once_and_private(tmp_path, monkeypatch):
+    monkeypatch.delenv(PlotServer.AUTHKEY_ENV, raising=False)
+    monkeypatch.setattr(PlotServer, "KEYFILE", tmp_path / "qcore/plot_server.key")
+    authkey = PlotServer.get_authkey()
+    assert len(authkey) == PlotServer.KEY_BYTES
+    assert PlotServer.get_authkey() == authkey
+    if os.name == "posix":
+        assert PlotServer.KEYFILE.stat().st_mode & 0o777 == 0o600
+
+    monkeypatch.setenv(PlotServer.AUTHKEY_ENV, "secret")
+    assert PlotServer.get_authkey() == b"secret"
+
+
+def test_client_sends_frames_to_server(tmp_path, monkeypatch, make_dataset):
+    monkeypatch.setattr(PlotServer, "ADDRESS", ("localhost", get_free_port()))
+    monkeypatch.setattr(PlotServer, "KEYFILE", tmp_path / "plot_server.key")
+    server = PlotServer()
+    thread = threading.Thread(target=server.serve, daemon=True)
+    thread.start()
+
+    dataset = make_dataset(plot=True)
+
+    client = connect(0.05, "test", None, dataset)
+    rng = np.random.default_rng(seed=0)
+    for i in range(1, 4):
+        data = rng.random((1, 3))
+        dataset.update((data, data[0], None), i - 1, i)
+        client.plot(message=f": {i}")
+        time.sleep(0.1)
+    client.plot(message=" done", stop=True)
+
+    plotted = server._plotter.datasets[0]
+    assert plotted.name == "I" and plotted.version == dataset.version
+    assert np.array_equal(plotted.avg, dataset.avg)
+    assert np.array_equal(plotted.sem, dataset.sem)
+    assert not client.stop_expt and not client._buffers
+
+    # close the plot window in the GUI thread to stop the server
+    layout = server._plotter.layout
+    queued = qtc.Qt.ConnectionType.QueuedConnection
+    qtc.QMetaObject.invokeMethod(layout, "close", queued)
+    thread.join(timeout=10)
+    assert not thread.is_alive()
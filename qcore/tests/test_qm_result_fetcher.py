@@ -0,0 +1,58 @@
+import numpy as np
+
+from qcore.instruments.drivers.qm_result_fetcher import QMResultFetcher, ResultBuffer
+
+
+class FakeHandle:
+    """running job handle without results, streams are added to the fetcher directly"""
+
+    def __iter__(self):
+        return iter([])
+
+    def is_processing(self):
+        return True
+
+
+def test_result_buffer_wraps_around_and_keeps_recent_batches():
+    buffer = ResultBuffer(depth=2)
+    batches = [np.full((3, 2), i, dtype=float) for i in range(5)]
+    views = [buffer.write(batch) for batch in batches]
+
+    assert buffer.capacity == 9  # depth + 1 batches
+    assert np.shares_memory(views[3], views[0])  # fourth batch wrapped to the start
+    for view, batch in zip(views[-2:], batches[-2:]):  # 'depth' batches stay intact
+        assert np.array_equal(view, batch)
+    assert buffer.empty.shape == (0, 2)
+
+
+def test_result_buffer_reallocates_for_larger_batches():
+    buffer = ResultBuffer(depth=2, max_rows=12)
+    small = buffer.write(np.ones((2, 2)))
+    assert buffer.capacity == 6
+
+    large = buffer.write(np.full((5, 2), 2.0))
+    assert buffer.capacity == 12  # 15 rows needed, capped at max_rows
+    assert not np.shares_memory(small, large)
+    assert np.array_equal(small, np.ones((2, 2)))  # old views remain valid
+
+    other = buffer.write(np.zeros((5, 3)))  # a new shape also reallocates
+    assert other.shape == (5, 3) and buffer.capacity == 12
+
+
+def test_buffer_batches_trims_lagging_streams():
+    qrf = QMResultFetcher(FakeHandle(), decimation={"B": 2})
+    qrf._buffers = {"A": ResultBuffer(), "B": ResultBuffer()}
+    qrf._last_count, qrf._count = 0, 10
+
+    # B saves one value per 2 results
+    data = {"A": np.arange(10.0), "B": np.arange(3.0)}
+    assert qrf._buffer_batches(data) == 6  # B has only caught up with 6 results
+    assert qrf._count == 6
+    assert np.array_equal(data["A"], np.arange(6.0))
+    assert np.array_equal(data["B"], np.arange(3.0))
+
+    # the trimmed results are fetched again with the next batch
+    qrf._last_count, qrf._count = 6, 10
+    data = {"A": np.arange(6.0, 10.0), "B": None}  # B has nothing new yet
+    assert qrf._buffer_batches(data) == 0
+    assert qrf._count == 6 and len(data["A"]) == 0 and len(data["B"]) == 0
@@ -0,0 +1,34 @@
+import numpy as np
+
+from qcore.libs.stats import RunningStats
+
+
+def test_batched_merge_matches_numpy():
+    rng = np.random.default_rng(seed=0)
+    data = rng.normal(size=(1000, 3, 4))
+    stats = RunningStats(shape=(3, 4))
+    start = 0
+    for size in rng.integers(0, 50, size=100):
+        stats.update(data[start : start + size])
+        start += size
+    stats.update(data[start:])
+
+    assert stats.count == len(data)
+    assert np.allclose(stats.mean, np.mean(data, axis=0))
+    assert np.allclose(stats.var, np.var(data, axis=0, ddof=1))
+    assert np.allclose(stats.sem, np.std(data, axis=0, ddof=1) / np.sqrt(len(data)))
+
+
+def test_merge_is_stable_for_large_offsets():
+    rng = np.random.default_rng(seed=1)
+    data = 1e8 + rng.normal(scale=1e-2, size=10**6)
+    stats = RunningStats()
+    for batch in np.array_split(data, 1000):
+        stats.update(batch)
+
+    assert np.isclose(stats.var, np.var(data, ddof=1), rtol=1e-6)
+
+
+if __name__ == "__main__":
+    test_batched_merge_matches_numpy()
+    test_merge_is_stable_for_large_offsets()
@@ -5,8 +5,9 @@ from typing import Any, Union
 import numpy as np
 
 from qcore.helpers.logger import logger
-from qcore.libs.data_fns import DATAFN_MAP
+from qcore.libs.data_fns import DATAFN_MAP, INCREMENTAL_DATAFNS
 from qcore.libs.fit_fns import FITFN_MAP
+from qcore.libs.stats import RunningStats
 from qcore.libs.qua_macros import QuaVariable
 from qcore.variables.sweeps import Sweep
 
@@ -25,7 +26,9 @@ class Dataset(QuaVariable):
     - dtype (data type the values are saved to the datafile with, default: float)
     - units (units attribute the dataset is saved to the datafile with, default: None)
     - fitfn
-    - datafn
+    - datafn (data_fns in INCREMENTAL_DATAFNS are evaluated on each new batch of raw
+    data and averaged, others only on the input averages, i.e. their raw data is not
+    saved)
     - inputs
     - datafn_args
     - plot_args
@@ -36,8 +39,32 @@ class Dataset(QuaVariable):
         - title: str
         - cmap (for image type plots only), default="viridis"
     - buffer_shape (for qua stream processing)
+    - raw: how raw (unaveraged) data of streamed datasets is transferred from the OPX
+        - "all": every shot is streamed and saved, default
+        - "decimated": averages of blocks of 'decimation' consecutive shots are streamed
+        and saved, the averaging axis of the saved data is shortened accordingly
+        - "none": only the running average is streamed and saved, no error bars
+        derived datasets inherit the raw mode of their input datasets
+    - decimation: number of shots averaged per block for raw = "decimated", default = 10
+    - compression: filter the dataset is compressed with in the datafile, one of
+    Dataset.COMPRESSIONS, "blosc" and "zstd" require hdf5plugin to be installed,
+    default = "lzf" for raw adc traces, else None (no compression). Every save_data()
+    call recompresses partially written chunks, so saving compressed datasets in
+    write-behind mode is faster.
+    - compression_opts: compression level, "gzip": 0-9 (default 4), "blosc": 0-9
+    (default 5), "zstd": 1-22 (default 3), not used by "lzf"
+    - shuffle: whether or not to byte-shuffle data before compression, which improves
+    the compression ratio of float data, default = True if compressed
+    - second_moment: if True, the running average of the squared data is also streamed
+    from the OPX (as '<name>_avg2') and var, std and sem are calculated from the first
+    and second moments, such that exact error bars are available without transferring
+    raw shots (e.g. with raw = "none"), default = False. The moment-based variance
+    suffers from cancellation when the mean is large compared to the spread, prefer
+    raw = "all" for such data.
     """
 
+    COMPRESSIONS = ("gzip", "lzf", "blosc", "zstd")
+
     def __init__(
         self,
         name: str,  # name of the dataset, as it will appear in the datafile
@@ -68,6 +95,8 @@ class Dataset(QuaVariable):
         self.datafn_args = kwargs.get("datafn_args", {})
         self.data = kwargs.get("data")
         self.avg, self.sem, self.var, self.std, self.count = None, None, None, None, 0
+        self._offset, self._prior_avg = 0, None  # restored from an interrupted run
+        self.version = 0  # incremented on every change of avg, to track it for plotting
 
         self._fitfn = None
         fitfn = kwargs.get("fitfn")
@@ -77,8 +106,38 @@ class Dataset(QuaVariable):
 
         self.plot_args = kwargs.get("plot_args", {})
 
+        raw = kwargs.get("raw", "all")
+        if raw not in Dataset.RAW_MODES:
+            message = f"Invalid {raw = } for dataset '{name}', {Dataset.RAW_MODES = }."
+            logger.error(message)
+            raise DatasetInitializationError(message)
+        decimation = kwargs.get("decimation", 10) if raw == "decimated" else 1
+        second_moment = kwargs.get("second_moment", False)
+
         buffer = kwargs.get("buffer")
-        super().__init__(self.dtype, stream=stream, tag=name, buffer=buffer)
+        super().__init__(
+            self.dtype,
+            stream=stream,
+            tag=name,
+            buffer=buffer,
+            raw=raw,
+            decimation=decimation,
+            second_moment=second_moment,
+        )
+
+        # raw adc traces are integer ADC levels, which compress well and fast with lzf
+        default_compression = "lzf" if self.is_adc_trace and raw == "all" else None
+        compression = kwargs.get("compression", default_compression)
+        if compression is not None and compression not in Dataset.COMPRESSIONS:
+            message = (
+                f"Invalid {compression = } for dataset '{name}', "
+                f"{Dataset.COMPRESSIONS = }."
+            )
+            logger.error(message)
+            raise DatasetInitializationError(message)
+        self.compression = compression
+        self.compression_opts = kwargs.get("compression_opts")
+        self.shuffle = kwargs.get("shuffle", compression is not None)
 
     def __repr__(self) -> str:
         """ """
@@ -110,6 +169,11 @@ class Dataset(QuaVariable):
             logger.error(message)
             raise DatasetInitializationError(message)
 
+    @property
+    def is_incremental(self) -> bool:
+        """whether the datafn can be evaluated on new batches of raw data alone"""
+        return self._datafn is not None and self._datafn.__name__ in INCREMENTAL_DATAFNS
+
     @property
     def fitfn(self):
         """ """
@@ -146,44 +210,126 @@ class Dataset(QuaVariable):
                 sdata[str(idx)] = np.arange(1, ax + 1, 1, dtype=int)
         return sdata
 
+    @property
+    def saved_axes(self):
+        """axes of the data saved to the datafile, which depend on the raw mode"""
+        if self._axes is None:
+            return
+        if self.raw == "none":  # only the average is saved
+            return self._axes[1:]
+        if self.raw == "decimated":  # the averaging axis holds blocks of shots
+            return [self.shape[0] // self.decimation, *self._axes[1:]]
+        return self._axes
+
+    @property
+    def saved_shape(self):
+        """ """
+        if self._axes is None:
+            return
+        return tuple(i.length if isinstance(i, Sweep) else i for i in self.saved_axes)
+
+    @property
+    def has_stats(self) -> bool:
+        """whether variance, std and sem can be estimated from the streamed data"""
+        return self.raw != "none" or self.second_moment
+
+    @property
+    def stats_count(self) -> int:
+        """number of samples the variance, std and sem are estimated from"""
+        if self.datafn is None and self.second_moment:  # from the streamed moments
+            return self.count - self._offset
+        return self._stats.count  # from the raw data, in blocks of 'decimation' shots
+
     @property
     def metadata(self) -> dict[str, Any]:
         """ """
-        return {"name": self.name, "dtype": self.dtype, "units": self.units}
+        mdata = {"name": self.name, "dtype": self.dtype, "units": self.units}
+        mdata["raw"] = self.raw
+        if self.raw == "decimated":
+            mdata["decimation"] = self.decimation
+        if self.second_moment:
+            mdata["second_moment"] = self.second_moment
+        return mdata
 
     def initialize(self, axes: list[Sweep]) -> None:
         """ """
         self.axes = axes
+        self.reset()
         shape = list(self.shape)
-        self.data = np.zeros(shape)
-        self.avg = np.average(self.data, axis=0)
-        self.std = np.average(self.data, axis=0)
-        self.sem = np.average(self.data, axis=0)
-        self.var = np.average(self.data, axis=0)
         if self.stream:
             shape.pop(0)
             self.buffer = shape
 
+    def reset(self) -> None:
+        """clear the data, averages and statistics gathered so far, to start a new
+        acquisition e.g. at the next point of an outer sweep"""
+        shape = self.shape[1:]
+        # raw data is kept in the datafile, in memory we only hold the latest batch
+        self.data, self.index = np.zeros((0, *shape)), None
+        self.avg, self.std = np.zeros(shape), np.zeros(shape)
+        self.sem, self.var = np.zeros(shape), np.zeros(shape)
+        self._stats = RunningStats(shape)
+        self.count, self._offset, self._prior_avg = 0, 0, None
+        self.best_fit, self.fit_params = None, None
+        self.version += 1
+
+    def restore(self, count: int, avg: np.ndarray, stats: RunningStats = None) -> None:
+        """restore the state of the dataset after 'count' repetitions of an interrupted
+        run, given their average and, for datasets with raw data, their running
+        statistics. the averages streamed in the resumed run are merged with the
+        restored average on update()"""
+        self._offset, self._prior_avg = count, avg
+        self.count, self.avg = count, avg
+        self.version += 1
+        if stats is not None:
+            self._stats = stats
+            self.var = stats.var * self.decimation
+            self.std, self.sem = np.sqrt(self.var), stats.sem
+
     def update(self, datasets, pnum, inum) -> None:
         """ """
         # update only if new data found
         if pnum == inum:
             return
 
+        avg2 = None  # average of squared data, only streamed for primary datasets
         if self.datafn is None:  # primary dataset
-            self.data, avg = datasets
-        else:  # derived dataset
-            input_data = [d.data for d in datasets]
-            self.data = self.datafn(input_data, **self.datafn_args)
+            self.data, avg = datasets[:2]
+            if self.second_moment:
+                avg2 = datasets[2]
+        elif self.raw == "none":  # derived dataset, evaluated on the input averages
             input_avg = [d.avg if isinstance(d, Dataset) else d.data for d in datasets]
             avg = self.datafn(input_avg, **self.datafn_args)
+        else:  # derived dataset, evaluated on the newly arrived batch only
+            input_data = [d.data for d in datasets]
+            self.data = self.datafn(input_data, **self.datafn_args)
+            # for nonlinear datafns, the datafn of the input averages is a different
+            # estimator than the one the stderr is calculated for, i.e. the mean
+            self._stats.update(self.data)
+            avg = self._stats.mean
+
+        if avg2 is not None:  # calculate stderr from the first and second moments
+            num = inum - self._offset  # the moments cover the streamed repetitions only
+            self.var = np.clip(avg2 - avg**2, 0, None) * num / max(num - 1, 1)
+            self.std, self.sem = np.sqrt(self.var), np.sqrt(self.var / inum)
 
+        if self.datafn is None and self._offset:  # merge with the restored average
+            num = inum - self._offset
+            avg = (self._offset * self._prior_avg + num * avg) / inum
+        self.avg, self.count = avg, inum
+        self.version += 1
+
+        if self.raw == "none":  # only the average is available and saved
+            self.data, self.index = avg, ...
+            return
+
+        # raw data arrives in blocks of 'decimation' shots
+        k = self.decimation
         # update index of next batch of data to be inserted in the datafile
-        self.index = (slice(pnum, inum), ...)
-
-        # calculate avg and stderr
-        k = pnum + inum
-        estimator = (self.data - self.avg) * (self.data - avg)
-        self.var = self.var * (pnum - 1)
-        self.var = (self.var + np.sum(estimator, axis=0)) / (inum - 1)
-        self.avg, self.std, self.sem = avg, np.sqrt(self.var), np.sqrt(self.var / k)
+        self.index = (slice(pnum // k, inum // k), ...)
+
+        if avg2 is None:  # calculate stderr from the raw data
+            if self.datafn is None:  # derived datasets are updated with their avg
+                self._stats.update(self.data)
+            self.var = self._stats.var * k  # variance of block means is var / k
+            self.std, self.sem = np.sqrt(self.var), self._stats.sem
@@ -121,8 +121,8 @@ class Sweep(QuaVariable):
         """ """
         return (self.length,)
 
-    def generate_loop(self):
-        """ """
+    def generate_loop(self, skip: int = 0):
+        """skip: number of leading sweep points to leave out of the loop"""
         message = f"Unsupported Sweep -> QUA loop conversion for {self}."
         if not self.is_qua_sweep:
             logger.error(message)
@@ -131,12 +131,13 @@ class Sweep(QuaVariable):
         var, dtype = self.qua_variable, self.dtype
 
         if isinstance(self.sweep_points, DiscretePoints):
-            return qua.for_each_, var, self.data.tolist()
+            return qua.for_each_, var, self.data[skip:].tolist()
         elif isinstance(self.sweep_points, RangePoints):
-            start, stop = self.sweep_points.start, self.sweep_points.stop
-            return qua.for_, var, start, var < stop, var + self.sweep_points.step
+            step, stop = self.sweep_points.step, self.sweep_points.stop
+            start = self.sweep_points.start + skip * step
+            return qua.for_, var, start, var < stop, var + step
         elif isinstance(self.sweep_points, LinSpacedPoints):
-            data, endpoint = self.sweep_points.data, self.sweep_points.endpoint
+            data, endpoint = self.sweep_points.data[skip:], self.sweep_points.endpoint
             if len(data) > 1:
                 start, stop, step = data[0], data[-1], data[1] - data[0]
                 pts = RangePoints(start, stop, step, endpoint, dtype)